@@ -23,6 +23,13 @@ class NotFoundError(BaseError):
         self.message = message
         self.status = 'NOT_FOUND'
 
+class BadRequestError(BaseError):
+    def __init__(self, message='Bad request'):
+        BaseError.__init__(self)
+        self.code = 400
+        self.message = message
+        self.status = 'BAD_REQUEST'
+
 class ServerError(BaseError):
     def __init__(self, message='Internal server error'):
         BaseError.__init__(self)
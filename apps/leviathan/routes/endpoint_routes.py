@@ -13,16 +13,22 @@
 # OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 #
 
-from flask import render_template, request, redirect, url_for, flash
+from flask import render_template, request, redirect, url_for, flash, Response, stream_with_context
 from flask_restx import Resource
 from http import HTTPStatus
-from ..models import NotFoundError
+from ..models import NotFoundError, BadRequestError
 from apps.leviathan import app, api, plugin_mods
 from apps.leviathan.forms import Search, Generic
 
 from apps.leviathan import retrieve, taskmgr
 
 
+def csv_response(lines):
+
+    return Response(stream_with_context(lines), mimetype="text/csv",
+                    headers={"Content-Disposition": "attachment; filename=export.csv"})
+
+
 @app.route('/endpoint_search', methods=['POST','GET'])
 def endpoint_search():
 
@@ -30,11 +36,6 @@ def endpoint_search():
     form = Search()
     device_query = None
 
-    #if a query string exists, query
-    if request.args.get("query"):
-        query = request.args.get("query")
-        device_query = retrieve.endpoint_info_query(query)
-
     if form.is_submitted():
 
         #if search button is pressed, get the query from the search box and redirect with requests
@@ -42,6 +43,15 @@ def endpoint_search():
             query = request.form.get("searchbar")
             return redirect(f"{request.url_root}endpoint_search?query={query}")
 
+        #stream every result of the current query rather than the rendered page
+        elif request.form.get("export_csv") is not None and request.args.get("query"):
+            return csv_response(retrieve.query_csv(request.args.get("query")))
+
+    #if a query string exists, query
+    if request.args.get("query"):
+        query = request.args.get("query")
+        device_query = retrieve.endpoint_info_query(query)
+
     return render_template('endpoint_search/endpoint_search.html', title='Endpoint Search', form=form,
                            searchbar=True,device_query=device_query, root_uri=request.url_root)
 
@@ -52,14 +62,7 @@ def extended_search():
     #method variables
     form = Search()
     search_query = None
-    query_type = None
-
-    #if a query string exists, query
-    if request.args.get("query"):
-        query = request.args.get("query")
-        query_type = request.args.get("query_type")
-        if query_type == "vlan":
-            search_query = retrieve.vlan_info_query(query)
+    query_type = request.args.get("query_type")
 
     if form.is_submitted():
 
@@ -69,6 +72,15 @@ def extended_search():
             query_type = request.form.get("query_type")
             return redirect(f"{request.url_root}extended_search?query={query}&query_type={query_type}")
 
+        elif request.form.get("export_csv") is not None and request.args.get("query") and query_type == "vlan":
+            return csv_response(retrieve.query_csv(request.args.get("query"), query_type=query_type))
+
+    #if a query string exists, query
+    if request.args.get("query"):
+        query = request.args.get("query")
+        if query_type == "vlan":
+            search_query = retrieve.vlan_info_query(query)
+
     return render_template('extended_search/extended_search.html', title='Extended Search', form=form,
                            searchbar=True,search_query=search_query, root_uri=request.url_root, query_type=query_type)
 
@@ -171,4 +183,43 @@ class api_endpoint_info(Resource):
         if endpoint_query:
             reseponse = {}
             reseponse['data'] = endpoint_query['data']
-            return reseponse
\ No newline at end of file
+            # data stops at SEARCH_RESULT_SIZE hits, total is the number of endpoints matching the query
+            reseponse['total'] = endpoint_query['total']
+            return reseponse
+
+
+@api.route('/api/endpoint_batch')
+class api_endpoint_batch(Resource):
+    @api.response(HTTPStatus.OK.value, "Run an action for every endpoint matching a query or in a list of endpoint ids")
+    @api.response(HTTPStatus.BAD_REQUEST.value, "Unknown action or no query or endpoint ids")
+    def post(self):
+        """ body: {"action": "device_info", "query": "..."} or {"action": "device_info", "endpoint_ids": [...]} """
+
+        body = request.get_json(silent=True) or {}
+        action = body.get("action")
+
+        if action not in taskmgr.actions:
+            raise BadRequestError(message=f"Action must be one of {','.join(taskmgr.actions)}")
+
+        if body.get("endpoint_ids"):
+            batch_id = taskmgr.batch_by_ids(action, body["endpoint_ids"])
+        elif body.get("query"):
+            batch_id = taskmgr.batch_by_query(action, body["query"])
+        else:
+            raise BadRequestError(message="Either query or endpoint_ids is required")
+
+        return taskmgr.batch_status(batch_id)
+
+
+@api.route('/api/endpoint_batch/<batch_id>')
+class api_endpoint_batch_status(Resource):
+    @api.response(HTTPStatus.OK.value, "Get the number of the batch's jobs in each status")
+    @api.response(HTTPStatus.NOT_FOUND.value, "Batch doesn't exist")
+    def get(self, batch_id):
+
+        batch = taskmgr.batch_status(batch_id)
+
+        if batch:
+            return batch
+
+        raise NotFoundError(message=f"Batch '{batch_id}' doesn't exist")
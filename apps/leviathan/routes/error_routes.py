@@ -1,7 +1,7 @@
 from flask import render_template
 
 from apps.leviathan import app, api
-from ..models import NotFoundError, ServerError
+from ..models import NotFoundError, BadRequestError, ServerError
 
 
 @app.errorhandler(404)
@@ -17,6 +17,11 @@ def handle_no_result_exception(error):
     '''Return a custom not found error message and 404 status code'''
     return error.to_dict(), 404
 
+@api.errorhandler(BadRequestError)
+def handle_bad_request_exception(error):
+    '''Return a custom bad request message and 400 status code'''
+    return error.to_dict(), 400
+
 @api.errorhandler(Exception)
 def default_error_handler(error):
     """Returns Internal server error"""
@@ -1,6 +1,4 @@
-from io import BytesIO
-
-from flask import render_template, send_file, request
+from flask import render_template, request, Response, stream_with_context
 
 from apps.leviathan import app
 from apps.leviathan.forms import Generic
@@ -12,21 +10,24 @@ def tasks():
 
     form = Generic()
 
-    task_info = {}
-
-    high_tasks = {"headers": ["description", "started_at", "finished_at","enqueued_at", "status"],
-                 "data_keys": ["description","started_at", "finished_at","enqueued_at", "status"],
-                 "data": retrieve.jobs_all(queue_name="high")}
+    # the status filter and page apply to every card
+    status = request.args.get("status") or None
+    page = request.args.get("page", default=1, type=int)
 
+    queues = {"High Tasks": "high", "Default Tasks": "default"}
 
-    task_info['High Tasks'] = high_tasks
-
-    default_tasks = {"headers": ["description","started_at", "finished_at","enqueued_at", "status"],
-                 "data_keys": ["description","started_at", "finished_at","enqueued_at", "status"],
-                 "data": retrieve.jobs_all(queue_name="default")}
+    task_info = {}
 
+    for card, queue_name in queues.items():
+        jobs = retrieve.jobs(queue_name, status=status, page=page)
 
-    task_info['Default Tasks'] = default_tasks
+        task_info[card] = {"headers": ["description", "started_at", "finished_at","enqueued_at", "status"],
+                           "data_keys": ["description","started_at", "finished_at","enqueued_at", "status"],
+                           "queue_name": queue_name,
+                           "counts": jobs['counts'],
+                           "total": jobs['total'],
+                           "pages": jobs['pages'],
+                           "data": jobs['data']}
 
     if form.is_submitted():
 
@@ -37,24 +38,18 @@ def tasks():
 
         elif request.form.get("export_csv"):
             card = request.form.get("export_csv")
-            response_csv = ",".join(task_info[card]['data_keys']) + "\n"
-            for item in task_info[card]['data']:
-                line = ''
-                for key in task_info[card]['data_keys']:
-                    try:
-                        line = line + f"{str(item[key]).replace(',', '')},"
-                    except KeyError as e:
-                        line = line + ","
-
-                line = line[:-1]
-                response_csv += line + "\n"
-
-            response_stream = BytesIO(response_csv.encode())
-            return send_file(
-                response_stream,
-                mimetype="text/csv",
-                attachment_filename=f"export.csv",
-                as_attachment=True,
-            )
-
-    return render_template('tasks/tasks.html', title='Tasks', form=form, task_info=task_info)
\ No newline at end of file
+            if card in task_info:
+                data_keys = task_info[card]['data_keys']
+                jobs = retrieve.jobs_iter(task_info[card]['queue_name'], status=status)
+
+                # every matching job is exported, a page at a time, not just the page being shown
+                def export():
+                    yield ",".join(data_keys) + "\n"
+                    for item in jobs:
+                        yield ",".join(str(item.get(key, '')).replace(',', '') for key in data_keys) + "\n"
+
+                return Response(stream_with_context(export()), mimetype="text/csv",
+                                headers={"Content-Disposition": "attachment; filename=export.csv"})
+
+    return render_template('tasks/tasks.html', title='Tasks', form=form, task_info=task_info, status=status,
+                           page=page, statuses=["queued", "started", "finished", "failed", "deferred", "scheduled"])
@@ -1,17 +1,10 @@
 from config import Config
-from models import ElasticIndex
-from config import Config
+from models import ElasticIndex, index_bodies
 
 appconfig = Config
 
-index_list = [appconfig.ENDPOINT_INDEX,
-              appconfig.NMAP_INDEX,
-              appconfig.VLAN_INDEX,
-              appconfig.EP_DETAILS_INDEX,
-              appconfig.INTERFACE_INDEX,
-              appconfig.GATEWAY_INDEX]
-
-for index_name in index_list:
+# every index is dropped and created again with its explicit mappings in a single request
+for index_name, body in index_bodies(appconfig).items():
     index = ElasticIndex(index_name, host=appconfig.ELASTIC_HOST, port=appconfig.ELASTIC_PORT)
     index.delete()
-    index.build()
\ No newline at end of file
+    index.build(body)
@@ -1,5 +1,5 @@
 import os
-from decouple import config as envconf
+from decouple import config as envconf, Csv, Choices
 import logging
 import importlib
 
@@ -13,8 +13,13 @@ class Config(object):
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'you-will-never-guess'
     ELASTIC_HOST = envconf("ELASTIC_HOST", default="localhost", cast=str)
     ELASTIC_PORT = envconf("ELASTIC_PORT", default="9200", cast=int)
+    ELASTIC_POOL_MAXSIZE = envconf("ELASTIC_POOL_MAXSIZE", default="25", cast=int)
+    ELASTIC_TIMEOUT = envconf("ELASTIC_TIMEOUT", default="30", cast=int)
+    ELASTIC_MAX_RETRIES = envconf("ELASTIC_MAX_RETRIES", default="3", cast=int)
+    ELASTIC_KEEPALIVE = envconf("ELASTIC_KEEPALIVE", default="true", cast=bool)
+    ELASTIC_METADATA_TTL = envconf("ELASTIC_METADATA_TTL", default="10", cast=int)
     ENDPOINT_INDEX = envconf("ENDPOINT_INDEX", default="endpoints", cast=str)
-    EP_DETAILS_INDEX = envconf("EP_DETAILS_INDEX", default="endpoints", cast=str)
+    EP_DETAILS_INDEX = envconf("EP_DETAILS_INDEX", default="ep_details", cast=str)
     NMAP_INDEX = envconf("NMAP_INDEX", default="nmap", cast=str)
     VLAN_INDEX = envconf("VLAN_INDEX", default="vlans", cast=str)
     INTERFACE_INDEX = envconf("INTERFACE_INDEX", default="interfaces", cast=str)
@@ -22,8 +27,52 @@ class Config(object):
     ZONE_INDEX = envconf("ZONE_INDEX", default="zones", cast=str)
     REDIS_HOST = envconf("REDIS_HOST", default="localhost", cast=str)
     REDIS_PORT = envconf("REDIS_PORT", default="6379", cast=int)
+    TASK_BATCH_TTL = envconf("TASK_BATCH_TTL", default="86400", cast=int)
+    DEVICE_LEASE_LIMIT = envconf("DEVICE_LEASE_LIMIT", default="1", cast=int)
+    DEVICE_LEASE_TTL = envconf("DEVICE_LEASE_TTL", default="600", cast=int)
+    DEVICE_LEASE_RETRY_DELAY = envconf("DEVICE_LEASE_RETRY_DELAY", default="30", cast=int)
+    DEVICE_LEASE_RETRIES = envconf("DEVICE_LEASE_RETRIES", default="20", cast=int)
+    TASK_DEDUPE_TTL = envconf("TASK_DEDUPE_TTL", default="3600", cast=int)
+    ENDPOINT_CACHE_TTL = envconf("ENDPOINT_CACHE_TTL", default="300", cast=int)
+    ENDPOINT_CACHE_SIZE = envconf("ENDPOINT_CACHE_SIZE", default="10000", cast=int)
     CREDENTIALS = envconf("CREDENTIALS", default=".credentials.yaml", cast=str)
+    DISCOVER_MAX_LOGINS = envconf("DISCOVER_MAX_LOGINS", default="3", cast=int)
+    CREDENTIAL_CACHE_TTL = envconf("CREDENTIAL_CACHE_TTL", default="604800", cast=int)
+    CREDENTIAL_CACHE_PREFIX = envconf("CREDENTIAL_CACHE_PREFIX", default="24", cast=int)
+    DNS_CACHE_TTL = envconf("DNS_CACHE_TTL", default="3600", cast=int)
+    DNS_NEGATIVE_TTL = envconf("DNS_NEGATIVE_TTL", default="300", cast=int)
+    DNS_WORKERS = envconf("DNS_WORKERS", default="32", cast=int)
+    DNS_TIMEOUT = envconf("DNS_TIMEOUT", default="5", cast=float)
+    SEARCH_RESULT_SIZE = envconf("SEARCH_RESULT_SIZE", default="1000", cast=int)
     NMAP_ENABLED = envconf("NMAP_ENABLED", default="true", cast=bool)
+    NMAP_BATCH = envconf("NMAP_BATCH", default="true", cast=bool)
+    NMAP_BATCH_WAIT = envconf("NMAP_BATCH_WAIT", default="15", cast=int)
+    NMAP_BATCH_WAIT_RETRIES = envconf("NMAP_BATCH_WAIT_RETRIES", default="40", cast=int)
+    NMAP_PORTS = envconf("NMAP_PORTS", default="22-1024,5601,8443,9200", cast=str)
+    NMAP_ARGUMENTS = envconf("NMAP_ARGUMENTS", default="-sV -T4", cast=str)
+    NMAP_HOSTGROUP = envconf("NMAP_HOSTGROUP", default="64", cast=int)
+    SCAN_ENGINE = envconf("SCAN_ENGINE", default="nmap", cast=Choices(["nmap", "asyncio"]))
+    SCAN_CONCURRENCY = envconf("SCAN_CONCURRENCY", default="1000", cast=int)
+    SCAN_HOST_CONCURRENCY = envconf("SCAN_HOST_CONCURRENCY", default="100", cast=int)
+    SCAN_TIMEOUT = envconf("SCAN_TIMEOUT", default="1", cast=float)
+    PIPELINE_QUEUE_SIZE = envconf("PIPELINE_QUEUE_SIZE", default="256", cast=int)
+    PIPELINE_DETECT_CONCURRENCY = envconf("PIPELINE_DETECT_CONCURRENCY", default="32", cast=int)
+    PIPELINE_INDEX_CONCURRENCY = envconf("PIPELINE_INDEX_CONCURRENCY", default="4", cast=int)
+    PIPELINE_NMAP_CONCURRENCY = envconf("PIPELINE_NMAP_CONCURRENCY", default="2", cast=int)
+    PIPELINE_NMAP_BATCH = envconf("PIPELINE_NMAP_BATCH", default="64", cast=int)
+    PIPELINE_DETAILS_CONCURRENCY = envconf("PIPELINE_DETAILS_CONCURRENCY", default="16", cast=int)
+    SWEEP_CONCURRENCY = envconf("SWEEP_CONCURRENCY", default="512", cast=int)
+    SWEEP_TIMEOUT = envconf("SWEEP_TIMEOUT", default="2", cast=float)
+    SWEEP_ICMP = envconf("SWEEP_ICMP", default="true", cast=bool)
+    SWEEP_TCP_PORTS = envconf("SWEEP_TCP_PORTS", default="22,443", cast=Csv(int))
+    SWEEP_CHUNK_SIZE = envconf("SWEEP_CHUNK_SIZE", default="256", cast=int)
+    SWEEP_CHECKPOINT_TTL = envconf("SWEEP_CHECKPOINT_TTL", default="604800", cast=int)
+    WORKER_QUEUES = envconf("WORKER_QUEUES", default="high,default", cast=Csv())
+    WORKER_MIN = envconf("WORKER_MIN", default="1", cast=int)
+    WORKER_MAX = envconf("WORKER_MAX", default="8", cast=int)
+    WORKER_JOBS_PER_WORKER = envconf("WORKER_JOBS_PER_WORKER", default="10", cast=int)
+    WORKER_SCALE_INTERVAL = envconf("WORKER_SCALE_INTERVAL", default="5", cast=float)
+    WORKER_SCALE_DOWN_DELAY = envconf("WORKER_SCALE_DOWN_DELAY", default="60", cast=float)
     PLUGIN_MODS = ['cisco_ios', 'paloalto_panos']
     PLUGINS = {}
 
@@ -1,3 +1,5 @@
 from .discover import Discover
 from .retrieve import Retrieve
-from .task import TaskMgr
\ No newline at end of file
+from .task import TaskMgr
+from .pipeline import Pipeline
+from .supervisor import WorkerSupervisor
\ No newline at end of file
@@ -1,57 +1,90 @@
-import os
-import platform
-from socket import gethostbyaddr, herror
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import yaml
-from netmiko import SSHDetect
+from netmiko import SSHDetect, ConnectHandler, redispatch
 import nmap
 import pytz
+from redis import Redis
+
+from models import DeviceLease
+from .sweeper import Sweeper
+from .credcache import CredentialCache
+from .resolver import Resolver
+from .portscan import ConnectScanner
 
 class Discover:
 
     def __init__(self, appconfig):
         self.credentials = appconfig.CREDENTIALS
+        self.max_logins = appconfig.DISCOVER_MAX_LOGINS
+        self.lease_limit = appconfig.DEVICE_LEASE_LIMIT
+        self.lease_ttl = appconfig.DEVICE_LEASE_TTL
+        self.nmap_ports = appconfig.NMAP_PORTS
+        self.nmap_arguments = appconfig.NMAP_ARGUMENTS
+        self.nmap_hostgroup = appconfig.NMAP_HOSTGROUP
+        self.scan_engine = appconfig.SCAN_ENGINE
+        self.connect_scanner = ConnectScanner(concurrency=appconfig.SCAN_CONCURRENCY,
+                                              host_concurrency=appconfig.SCAN_HOST_CONCURRENCY,
+                                              timeout=appconfig.SCAN_TIMEOUT)
+        self.sweeper = Sweeper(concurrency=appconfig.SWEEP_CONCURRENCY,
+                               timeout=appconfig.SWEEP_TIMEOUT,
+                               tcp_ports=appconfig.SWEEP_TCP_PORTS,
+                               icmp=appconfig.SWEEP_ICMP)
+
+        redis_connection = Redis(host=appconfig.REDIS_HOST, port=appconfig.REDIS_PORT, db=0)
+        self.redis_connection = redis_connection
+        self.credential_cache = CredentialCache(redis_connection,
+                                                ttl=appconfig.CREDENTIAL_CACHE_TTL,
+                                                subnet_prefix=appconfig.CREDENTIAL_CACHE_PREFIX)
+        self.resolver = Resolver(redis_connection,
+                                 ttl=appconfig.DNS_CACHE_TTL,
+                                 negative_ttl=appconfig.DNS_NEGATIVE_TTL,
+                                 workers=appconfig.DNS_WORKERS,
+                                 timeout=appconfig.DNS_TIMEOUT)
+
+        # authenticated ssh sessions kept by device_info(keep_session=True) and the leases they are logged in
+        # under, keyed by ip
+        self.sessions = {}
+        self.leases = {}
 
     def ping(self, ip):
-        """ Pings the IP given and if a response is found, add to redis queue
+        """ Pings the IP given and returns true if a response is found
         Parameters
         ----------
             ip:str
                 ip address of target device
         """
 
-        #set the appropriate os level ping parameter
-        current_os = platform.system().lower()
-        if current_os == "windows":
-            parameter = "-n"
-        else:
-            parameter = "-c"
+        return str(ip) in self.sweeper.sweep(str(ip))
 
-        #perform the ping check against the ip using the os ping command
-        ping_check = os.system(f"ping {parameter} 1 -w2 {str(ip)} > /dev/null 2>&1")
+    def sweep(self, network):
+        """ Sweeps every host in the network concurrently and returns the live ip addresses
+        Parameters
+        ----------
+            network:str
+                cidr network (or single ip address) to sweep
+        """
 
-        #if ping is 0 (meaning response) return true, if not return false
-        if ping_check == 0:
-            return True
-        else:
-            return False
+        return self.sweeper.sweep(network)
 
-    def device_info(self, ip):
+    def device_info(self, ip, keep_session=False):
         """ attempts to ssh into the device and determine the device-type then records the inormation into elasticsearch
+
+        The logins happen under the device lease.  Detection has its own allowance of DISCOVER_MAX_LOGINS logins to
+        race the credentials over, which it only gets while no other task holds the device, and other tasks wait for
+        it the same way.  Raises models.DeviceBusy when the device is in use.
         Parameters
         ----------
             ip:str
                 ip address of target device
+            keep_session:bool
+                keep the authenticated ssh session in self.sessions so plugins in the same process can reuse it, one
+                login of the lease stays held for it in self.leases until pop_lease or discard_session
         """
 
-        # try to get the hostname
-        # TODO does this need to be an error or can it be explicit?
-        try:
-            hostname = gethostbyaddr(ip)
-            hostname = hostname[0]
-        except herror:
-            hostname = ip
+        # get the hostname from the shared resolver cache, falls back to the ip if there is no PTR record
+        hostname = self.resolver.resolve(ip)
 
         # create the record dictionary
         record = {
@@ -65,41 +98,266 @@ class Discover:
         with open(self.credentials, "r") as file:
             credentials = yaml.full_load(file)
 
-        # for each credential, loop and try until success
-        for credential in credentials:
-
-            # create the net device dictionary
-            net_device = {
-                'device_type': 'autodetect',
-                'ip': ip,
-                'username': credential['username'],
-                'password': credential['password'],
-                'secret': credential['secret'],
-                'port': 22,
-            }
+        # every holder checks its own limit against all the logins held on the device, so detection taking
+        # DISCOVER_MAX_LOGINS logins under a limit of the same size keeps the device to itself while it runs
+        limit = max(self.lease_limit, self.max_logins)
 
-            # try to perform SShDetect from netmiko
-            try:
-                guesser = SSHDetect(**net_device)
-                device_type = guesser.autodetect()
+        with DeviceLease(self.redis_connection, ip, limit=limit, ttl=self.lease_ttl, count=self.max_logins) as lease:
 
-                if device_type:
-                    pass
-                else:
-                    device_type = "unknown"
+            # try the pair that last worked for this host or subnet, then race every credential if it fails
+            result = self.probe_cached(ip, credentials, keep_session)
 
-            # exception (such as ssh timeout) consider the device type to be unknown
-            except Exception as e:
-                device_type = "unknown"
+            if not result:
+                result = self.probe_credentials(ip, credentials, keep_session, lease.count)
+
+            # the kept session is still a login to the device, so it keeps one login of the lease
+            if keep_session and ip in self.sessions:
+                self.keep_lease(ip, lease.handoff(1))
 
-            # if the device type is not unknown, set the credential and device type from SSHDetect and break the loop
-            if "unknown" not in device_type:
-                record['credential'] = str(credential['id'])
-                record['device_type'] = device_type
-                break
+        if result:
+            credential, device_type = result
+            record['credential'] = str(credential['id'])
+            record['device_type'] = device_type
+            self.credential_cache.set(ip, credential['id'], device_type)
+        else:
+            self.credential_cache.delete(ip)
 
         return record
 
+    def probe_cached(self, ip, credentials, keep_session=False):
+        """ logs in with the cached (credential id, device type) pairs for the host, skipping autodetect
+        Parameters
+        ----------
+            ip:str
+                ip address of target device
+            credentials:list
+                credential dictionaries from the credential file
+            keep_session:bool
+                keep the successful session in self.sessions
+
+        Returns
+        -------
+            (credential, device_type) tuple or None if no cached pair logged in
+        """
+
+        for credential_id, device_type in self.credential_cache.candidates(ip):
+
+            # the credential may have been removed from the file since it was cached
+            credential = next((c for c in credentials if str(c['id']) == credential_id), None)
+
+            if credential and self.verify(ip, credential, device_type, keep_session):
+                return credential, device_type
+
+        return None
+
+    def verify(self, ip, credential, device_type, keep_session=False):
+        """ returns true if the credential logs into the device as the given device type
+        Parameters
+        ----------
+            ip:str
+                ip address of target device
+            credential:dict
+                credential dictionary from the credential file
+            device_type:str
+                netmiko device type
+            keep_session:bool
+                keep the session in self.sessions instead of disconnecting
+        """
+
+        net_device = {
+            'device_type': device_type,
+            'ip': ip,
+            'username': credential['username'],
+            'password': credential['password'],
+            'secret': credential['secret'],
+            'port': 22,
+        }
+
+        try:
+            connection = ConnectHandler(**net_device)
+        except Exception:
+            return False
+
+        if keep_session:
+            self.keep_session(ip, connection)
+        else:
+            self.close_session(connection)
+
+        return True
+
+    def probe_credentials(self, ip, credentials, keep_session=False, max_logins=None):
+        """ runs SSHDetect with each credential in a bounded thread pool and returns the first success
+        Parameters
+        ----------
+            ip:str
+                ip address of target device
+            credentials:list
+                credential dictionaries from the credential file
+            keep_session:bool
+                keep the winning session in self.sessions
+            max_logins:int
+                logins raced at once, defaults to DISCOVER_MAX_LOGINS
+
+        Returns
+        -------
+            (credential, device_type) tuple or None if no credential succeeded
+        """
+
+        if not credentials:
+            return None
+
+        # the pool size is the cap on concurrent logins against this host
+        executor = ThreadPoolExecutor(max_workers=min(max_logins or self.max_logins, len(credentials)))
+        futures = {executor.submit(self.detect, ip, credential, keep_session): credential
+                   for credential in credentials}
+        winner = None
+
+        try:
+            for future in as_completed(futures):
+                device_type, connection = future.result()
+
+                # if the device type is not unknown, return the credential and device type from SSHDetect
+                if "unknown" not in device_type:
+                    winner = future
+                    if connection:
+                        self.keep_session(ip, connection)
+                    return futures[future], device_type
+        finally:
+            # stop any credentials that have not started a login yet, sessions from any other login are closed
+            for future in futures:
+                if future is not winner:
+                    future.cancel()
+                    future.add_done_callback(self._discard_detect)
+            executor.shutdown(wait=False)
+
+        return None
+
+    def detect(self, ip, credential, keep_session=False):
+        """ attempts SSHDetect against the device with a single credential
+        Parameters
+        ----------
+            ip:str
+                ip address of target device
+            credential:dict
+                credential dictionary from the credential file
+            keep_session:bool
+                return the authenticated session, redispatched to the detected device type, instead of closing it
+
+        Returns
+        -------
+            (device_type, connection) tuple, connection is None unless keep_session is set and detection succeeded
+        """
+
+        # create the net device dictionary
+        net_device = {
+            'device_type': 'autodetect',
+            'ip': ip,
+            'username': credential['username'],
+            'password': credential['password'],
+            'secret': credential['secret'],
+            'port': 22,
+        }
+
+        # try to perform SShDetect from netmiko
+        guesser = None
+        connection = None
+        try:
+            guesser = SSHDetect(**net_device)
+            device_type = guesser.autodetect()
+
+            if device_type:
+                pass
+            else:
+                device_type = "unknown"
+
+        # exception (such as ssh timeout) consider the device type to be unknown
+        except Exception as e:
+            device_type = "unknown"
+
+        finally:
+            if guesser:
+                if keep_session and "unknown" not in device_type:
+                    connection = self.redispatch_session(guesser.connection, device_type)
+                else:
+                    self.close_session(guesser.connection)
+
+        return device_type, connection
+
+    def redispatch_session(self, connection, device_type):
+        """ turns the autodetect session into a session for the detected device type, None if that fails """
+
+        try:
+            redispatch(connection, device_type=device_type)
+            # SSHDetect turns off command verification, give it back to the real device type
+            connection.global_cmd_verify = None
+        except Exception:
+            self.close_session(connection)
+            return None
+
+        return connection
+
+    def keep_session(self, ip, connection):
+        """ stores the session for the ip, closing any session already stored for it """
+
+        previous = self.sessions.pop(ip, None)
+        if previous is not None and previous is not connection:
+            self.close_session(previous)
+
+        self.sessions[ip] = connection
+
+    def pop_session(self, ip):
+        """ removes and returns the session kept for the ip, None if there is not one """
+
+        return self.sessions.pop(ip, None)
+
+    def keep_lease(self, ip, lease):
+
+        previous = self.leases.pop(ip, None)
+        if previous is not None:
+            previous.release()
+
+        self.leases[ip] = lease
+
+    def pop_lease(self, ip):
+        """ removes and returns the lease held for the session kept for the ip, the caller releases it """
+
+        return self.leases.pop(ip, None)
+
+    def discard_session(self, ip):
+        """ closes the session kept for the ip and releases its lease """
+
+        self.close_session(self.pop_session(ip))
+
+        lease = self.pop_lease(ip)
+        if lease is not None:
+            lease.release()
+
+    def close_sessions(self):
+        """ closes every session that was kept and never handed off """
+
+        for ip in set(self.sessions) | set(self.leases):
+            self.discard_session(ip)
+
+    @staticmethod
+    def close_session(connection):
+
+        if connection is None:
+            return
+
+        try:
+            connection.disconnect()
+        except Exception:
+            pass
+
+    def _discard_detect(self, future):
+        """ done callback that closes the session of a detect that lost the credential race """
+
+        if future.cancelled() or future.exception() is not None:
+            return
+
+        _, connection = future.result()
+        self.close_session(connection)
+
     def nmap_info(self, ip, hostname=None):
         """ performs nmap scan, formats with a timestamp and returns
 
@@ -110,29 +368,62 @@ class Discover:
             hostname: str
                 hostname of the device (DNS record)
         """
-        # TODO add hostname lookup
-        # TODO add arg for the ports to be scanned (TCP)
 
-        nm = nmap.PortScanner()
-        scan_info = nm.scan(ip, '22-1024,5601,8443,9200')
+        hostnames = {ip: hostname} if hostname else None
+
+        return self.nmap_info_many([ip], hostnames)[ip]
+
+    def nmap_info_many(self, ips, hostnames=None):
+        """ performs a single port scan across many hosts and splits the results into one document per host
+
+        The scan engine is selected by SCAN_ENGINE, either "nmap" or "asyncio" for the built in connect scanner.
+
+        Parameters
+        ----------
+            ips:list
+                ip addresses of the target devices
+            hostnames: dict
+                ip to hostname of the devices (DNS record), defaults to the ip
+        """
 
-        # if the scan returns information for the ip, reformat the return dictionary
-        if ip in scan_info['scan']:
-            scan_info['scan'] = scan_info['scan'][ip]
+        if not ips:
+            return {}
+
+        if not hostnames:
+            hostnames = {}
+
+        if self.scan_engine == "asyncio":
+            # connect scan from the event loop, no nmap process required
+            scan_info = self.connect_scanner.scan(" ".join(ips), self.nmap_ports)
+        else:
+            # scan the hosts in groups so nmap parallelizes across hosts instead of one host at a time
+            hostgroup = min(len(ips), self.nmap_hostgroup)
+            arguments = f"{self.nmap_arguments} --min-hostgroup {hostgroup} --max-hostgroup {hostgroup}"
+
+            nm = nmap.PortScanner()
+            scan_info = nm.scan(" ".join(ips), self.nmap_ports, arguments=arguments)
+
+        timestamp = self.timestamp()
+
+        results = {}
+        for ip in ips:
+
+            # apply extra info to each host's scan results, hosts that did not respond get an empty scan
+            results[ip] = {
+                'nmap': dict(scan_info['nmap']),
+                'scan': scan_info['scan'].get(ip, {}),
+                '@timestamp': timestamp,
+                'hostname': hostnames.get(ip) or ip,
+            }
+
+        return results
+
+    def timestamp(self):
+        """ generates the timestamp used for scan documents """
 
-        # generate the timestamp
         date_time_obj = datetime.strptime(str(datetime.now().strftime('%Y-%m-%dT%H:%M:%S.%f%z')),
                                           '%Y-%m-%dT%H:%M:%S.%f')
         timezone = pytz.timezone('America/New_York')
         timezone_date_time_obj = timezone.localize(date_time_obj)
 
-        if hostname:
-            pass
-        else:
-            hostname = ip
-
-        # apply extra info to the nmap scan results
-        scan_info['@timestamp'] = timezone_date_time_obj.strftime('%Y-%m-%dT%H:%M:%S.%f%z')
-        scan_info['hostname'] = hostname
-
-        return scan_info
+        return timezone_date_time_obj.strftime('%Y-%m-%dT%H:%M:%S.%f%z')
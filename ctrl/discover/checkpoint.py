@@ -0,0 +1,125 @@
+import json
+import uuid
+from datetime import datetime
+
+
+class SweepCheckpoint:
+    """ redis checkpoint of a sweep so it can be resumed after a worker dies
+
+    The checkpoint records the chunks that have been swept, the live hosts found in them, and which hosts finished
+    each stage (device_info, nmap, details) along with the endpoint record so later stages can be resumed without
+    detecting the device again.  Every key expires after the ttl.
+
+    Attributes
+    ----------
+    redis_connection: redis.Redis
+        connection used to store the checkpoint
+    sweep_id: str
+        id of the sweep
+    ttl: int
+        seconds the checkpoint is kept
+    """
+
+    key_prefix = "leviathan:sweep"
+    stages = ["device_info", "nmap", "details"]
+
+    def __init__(self, redis_connection, sweep_id, ttl=604800):
+
+        self.redis_connection = redis_connection
+        self.sweep_id = sweep_id
+        self.ttl = ttl
+
+    @staticmethod
+    def new_id():
+
+        return uuid.uuid4().hex
+
+    def key(self, name):
+
+        return f"{self.key_prefix}:{self.sweep_id}:{name}"
+
+    def _expire(self, pipe, *names):
+
+        for name in names:
+            pipe.expire(self.key(name), self.ttl)
+
+    def create(self, cidr, chunk_size):
+        """ records the sweep parameters, an existing checkpoint for the same id is left untouched """
+
+        meta = {
+            "cidr": cidr,
+            "chunk_size": str(chunk_size),
+            "created": str(datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+        }
+
+        with self.redis_connection.pipeline() as pipe:
+            for field, value in meta.items():
+                pipe.hsetnx(self.key("meta"), field, value)
+            self._expire(pipe, "meta")
+            pipe.execute()
+
+    def meta(self):
+        """ returns the sweep parameters, None if the checkpoint does not exist or has expired """
+
+        meta = self.redis_connection.hgetall(self.key("meta"))
+
+        if not meta:
+            return None
+
+        return {k.decode(): v.decode() for k, v in meta.items()}
+
+    def chunk_done(self, chunk, live_ips):
+        """ records that the chunk has been swept and the live hosts that were found in it """
+
+        with self.redis_connection.pipeline() as pipe:
+            if live_ips:
+                pipe.sadd(self.key("live"), *live_ips)
+            pipe.sadd(self.key("chunks"), str(chunk))
+            self._expire(pipe, "live", "chunks")
+            pipe.execute()
+
+    def chunks_done(self):
+
+        return {c.decode() for c in self.redis_connection.smembers(self.key("chunks"))}
+
+    def live(self):
+
+        return {ip.decode() for ip in self.redis_connection.smembers(self.key("live"))}
+
+    def complete(self, stage, ips, records=None):
+        """ marks the hosts as having finished the stage
+        Parameters
+        ----------
+            stage:str
+                one of SweepCheckpoint.stages
+            ips:list
+                ip addresses that finished the stage
+            records:list
+                endpoint records to keep for resuming later stages, only given for the device_info stage
+        """
+
+        if not ips:
+            return
+
+        with self.redis_connection.pipeline() as pipe:
+            if records:
+                pipe.hset(self.key("records"), mapping={r['ip']: json.dumps(r) for r in records})
+                self._expire(pipe, "records")
+            pipe.sadd(self.key(f"stage:{stage}"), *ips)
+            self._expire(pipe, f"stage:{stage}")
+            pipe.execute()
+
+    def completed(self, stage):
+
+        return {ip.decode() for ip in self.redis_connection.smembers(self.key(f"stage:{stage}"))}
+
+    def records(self, ips):
+        """ returns a dictionary of ip to the endpoint record saved by the device_info stage """
+
+        ips = list(ips)
+        if not ips:
+            return {}
+
+        values = self.redis_connection.hmget(self.key("records"), ips)
+
+        return {ip: json.loads(value) for ip, value in zip(ips, values) if value}
@@ -0,0 +1,98 @@
+import ipaddress
+import logging
+
+from redis.exceptions import RedisError
+
+
+class CredentialCache:
+    """ redis cache of the last (credential id, device type) pair that logged into a host
+
+    Pairs are stored per ip and per subnet so a host that has never been discovered can still try the pair that
+    worked for its neighbors first.  Redis errors are logged and treated as a cache miss so discovery never fails
+    because of the cache.
+
+    Attributes
+    ----------
+    redis_connection: redis.Redis
+        connection used to store the cache keys
+    ttl: int
+        seconds before a learned pair expires
+    subnet_prefix: int
+        prefix length used to group hosts into subnets
+    """
+
+    key_prefix = "leviathan:credential"
+
+    def __init__(self, redis_connection, ttl=604800, subnet_prefix=24):
+
+        self.redis_connection = redis_connection
+        self.ttl = ttl
+        self.subnet_prefix = subnet_prefix
+
+    def ip_key(self, ip):
+
+        return f"{self.key_prefix}:ip:{ip}"
+
+    def subnet_key(self, ip):
+
+        subnet = ipaddress.ip_network(f"{ip}/{self.subnet_prefix}", strict=False)
+        return f"{self.key_prefix}:subnet:{subnet}"
+
+    def candidates(self, ip):
+        """ returns the cached (credential id, device type) pairs for the ip, host entry first then subnet entry
+        Parameters
+        ----------
+            ip:str
+                ip address of target device
+        """
+
+        try:
+            with self.redis_connection.pipeline() as pipe:
+                pipe.hgetall(self.ip_key(ip))
+                pipe.hgetall(self.subnet_key(ip))
+                entries = pipe.execute()
+        except RedisError as e:
+            logging.warning(f"credential cache unavailable for {ip} due to {e}")
+            return []
+
+        pairs = []
+        for entry in entries:
+            if not entry:
+                continue
+
+            pair = (entry[b'credential'].decode(), entry[b'device_type'].decode())
+            if pair not in pairs:
+                pairs.append(pair)
+
+        return pairs
+
+    def set(self, ip, credential_id, device_type):
+        """ records the pair that logged into the ip for both the host and its subnet
+        Parameters
+        ----------
+            ip:str
+                ip address of target device
+            credential_id:str
+                id of the credential from the credential file
+            device_type:str
+                netmiko device type
+        """
+
+        mapping = {"credential": str(credential_id), "device_type": device_type}
+
+        try:
+            with self.redis_connection.pipeline() as pipe:
+                for key in (self.ip_key(ip), self.subnet_key(ip)):
+                    pipe.hset(key, mapping=mapping)
+                    pipe.expire(key, self.ttl)
+                pipe.execute()
+        except RedisError as e:
+            logging.warning(f"failed to cache credential for {ip} due to {e}")
+
+    def delete(self, ip):
+        """ forgets the pair learned for the ip, the subnet entry is left for its neighbors """
+
+        try:
+            self.redis_connection.delete(self.ip_key(ip))
+        except RedisError as e:
+            logging.warning(f"failed to clear cached credential for {ip} due to {e}")
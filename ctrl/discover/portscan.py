@@ -0,0 +1,163 @@
+import asyncio
+import ipaddress
+import socket
+import time
+
+
+class ConnectScanner:
+    """ pure python tcp connect scanner driven by a single event loop
+
+    Returns the same dictionary layout as nmap.PortScanner().scan() so the documents written to the nmap index keep
+    their shape whichever engine produced them.  Only open ports are listed, and a host that neither accepted nor
+    refused a connection is left out of the results the same way nmap leaves out hosts that are down.
+
+    Attributes
+    ----------
+    concurrency: int
+        maximum number of connection attempts in flight across every host
+    host_concurrency: int
+        maximum number of connection attempts in flight against a single host
+    timeout: float
+        seconds to wait for each connection attempt
+    """
+
+    def __init__(self, concurrency=1000, host_concurrency=100, timeout=1.0):
+
+        self.concurrency = concurrency
+        self.host_concurrency = host_concurrency
+        self.timeout = timeout
+
+    @staticmethod
+    def parse_ports(ports):
+        """ expands an nmap style port string such as '22-1024,5601,8443' into a sorted list of ports """
+
+        expanded = set()
+
+        for part in str(ports).split(","):
+            part = part.strip()
+            if not part:
+                continue
+
+            if "-" in part:
+                start, end = part.split("-", 1)
+                expanded.update(range(int(start), int(end) + 1))
+            else:
+                expanded.add(int(part))
+
+        return sorted(expanded)
+
+    @staticmethod
+    def service_name(port):
+
+        try:
+            return socket.getservbyport(port, "tcp")
+        except OSError:
+            return ""
+
+    def scan(self, hosts, ports):
+        """ connect scans the ports on every host
+        Parameters
+        ----------
+            hosts:str
+                space separated ip addresses, the same argument nmap.PortScanner().scan() takes
+            ports:str
+                nmap style port string
+        """
+
+        return asyncio.run(self.async_scan(hosts.split(), ports))
+
+    async def async_scan(self, hosts, ports):
+        """ coroutine version of scan for callers already running inside an event loop
+        Parameters
+        ----------
+            hosts:list
+                ip addresses as strings
+            ports:str
+                nmap style port string
+        """
+
+        port_list = self.parse_ports(ports)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        start = time.time()
+        results = await asyncio.gather(*(self._scan_host(ip, port_list, semaphore) for ip in hosts))
+        elapsed = time.time() - start
+
+        scan = {ip: host for ip, host in zip(hosts, results) if host}
+
+        return {
+            'nmap': {
+                'command_line': f"connect scan -p {ports} {' '.join(hosts)}",
+                'scaninfo': {'tcp': {'method': 'connect', 'services': ports}},
+                'scanstats': {
+                    'timestr': time.ctime(start),
+                    'elapsed': f"{elapsed:.2f}",
+                    'uphosts': str(len(scan)),
+                    'downhosts': str(len(hosts) - len(scan)),
+                    'totalhosts': str(len(hosts)),
+                },
+            },
+            'scan': scan,
+        }
+
+    async def _probe(self, ip, port, semaphore):
+        """ returns 'open', 'closed' or None when nothing answered """
+
+        async with semaphore:
+            try:
+                _, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout=self.timeout)
+            except ConnectionRefusedError:
+                return "closed"
+            except (OSError, asyncio.TimeoutError):
+                return None
+
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+            return "open"
+
+    async def _scan_host(self, ip, ports, semaphore):
+
+        remaining = iter(ports)
+        states = {}
+
+        # a fixed number of workers per host pull ports from the shared iterator
+        async def worker():
+            for port in remaining:
+                states[port] = await self._probe(ip, port, semaphore)
+
+        await asyncio.gather(*(worker() for _ in range(min(self.host_concurrency, len(ports)) or 1)))
+
+        open_ports = sorted(port for port, state in states.items() if state == "open")
+        refused = any(state == "closed" for state in states.values())
+
+        if not open_ports and not refused:
+            return None
+
+        tcp = {}
+        for port in open_ports:
+            tcp[port] = {
+                'state': 'open',
+                'reason': 'syn-ack',
+                'name': self.service_name(port),
+                'product': '',
+                'version': '',
+                'extrainfo': '',
+                'conf': '3',
+                'cpe': '',
+            }
+
+        host = {
+            'hostnames': [],
+            'addresses': {'ipv6' if ipaddress.ip_address(ip).version == 6 else 'ipv4': ip},
+            'vendor': {},
+            'status': {'state': 'up', 'reason': 'syn-ack' if open_ports else 'conn-refused'},
+        }
+
+        if tcp:
+            host['tcp'] = tcp
+
+        return host
@@ -0,0 +1,127 @@
+import logging
+import math
+from concurrent.futures import ThreadPoolExecutor, wait
+from socket import gethostbyaddr
+
+from redis.exceptions import RedisError
+
+
+class Resolver:
+    """ batched reverse dns resolver with a redis cache shared by every worker
+
+    Lookups run concurrently in a thread pool since gethostbyaddr blocks.  Positive and negative answers are cached
+    with separate ttls.  Each lookup gets its own timeout, a lookup that never finished is not cached so the next
+    resolve tries it again.  When no PTR record exists, or the lookup did not finish, the ip itself is returned as the
+    hostname, matching what discovery has always recorded.
+
+    Attributes
+    ----------
+    redis_connection: redis.Redis
+        connection used to store the cache keys
+    ttl: int
+        seconds a resolved hostname is cached
+    negative_ttl: int
+        seconds a failed lookup is cached
+    workers: int
+        maximum number of lookups in flight
+    timeout: float
+        seconds to wait for each lookup
+    """
+
+    key_prefix = "leviathan:dns"
+
+    def __init__(self, redis_connection, ttl=3600, negative_ttl=300, workers=32, timeout=5.0):
+
+        self.redis_connection = redis_connection
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.workers = workers
+        self.timeout = timeout
+
+    def key(self, ip):
+
+        return f"{self.key_prefix}:{ip}"
+
+    def resolve(self, ip):
+        """ returns the hostname for a single ip, or the ip if it has no PTR record
+        Parameters
+        ----------
+            ip:str
+                ip address of target device
+        """
+
+        return self.resolve_many([ip])[ip]
+
+    def resolve_many(self, ips):
+        """ resolves many ips concurrently and returns a dictionary of ip to hostname
+        Parameters
+        ----------
+            ips:list
+                ip addresses as strings
+        """
+
+        ips = list(dict.fromkeys(ips))
+        hostnames = {}
+
+        # read every cached answer in one round trip, an empty string is a cached negative answer
+        try:
+            cached = self.redis_connection.mget([self.key(ip) for ip in ips]) if ips else []
+        except RedisError as e:
+            logging.warning(f"dns cache unavailable due to {e}")
+            cached = [None] * len(ips)
+
+        misses = []
+        for ip, answer in zip(ips, cached):
+            if answer is None:
+                misses.append(ip)
+            else:
+                hostnames[ip] = answer.decode() or ip
+
+        if misses:
+            resolved = self._lookup(misses)
+            self._store(resolved)
+
+            for ip in misses:
+                hostnames[ip] = resolved.get(ip) or ip
+
+        return hostnames
+
+    @staticmethod
+    def _gethostbyaddr(ip):
+
+        try:
+            return gethostbyaddr(ip)[0]
+        except OSError:
+            return None
+
+    def _lookup(self, ips):
+        """ runs the lookups in the thread pool, returns a dictionary of ip to hostname, or None when there is no PTR
+        record, for the lookups that finished """
+
+        workers = min(self.workers, len(ips))
+        executor = ThreadPoolExecutor(max_workers=workers)
+        futures = {executor.submit(self._gethostbyaddr, ip): ip for ip in ips}
+
+        try:
+            # lookups queued behind a full pool still get their own timeout once they start
+            wait(futures, timeout=self.timeout * math.ceil(len(ips) / workers))
+        finally:
+            # lookups still blocked in the resolver are abandoned rather than waited on
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+        return {ip: future.result() for future, ip in futures.items() if future.done() and not future.cancelled()}
+
+    def _store(self, resolved):
+
+        try:
+            with self.redis_connection.pipeline() as pipe:
+                for ip, hostname in resolved.items():
+                    if hostname:
+                        pipe.set(self.key(ip), hostname, ex=self.ttl)
+                    else:
+                        pipe.set(self.key(ip), "", ex=self.negative_ttl)
+                pipe.execute()
+        except RedisError as e:
+            logging.warning(f"failed to cache dns answers due to {e}")
@@ -0,0 +1,226 @@
+import asyncio
+import ipaddress
+import itertools
+import logging
+import os
+import socket
+import struct
+import time
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+
+
+class Sweeper:
+    """ liveness sweep engine that probes an entire network from one event loop
+
+    Every address is sent a single ICMP echo from a shared socket (unprivileged datagram ICMP where the kernel
+    allows it, raw ICMP when running as root).  Addresses that do not answer, or every address when ICMP is not
+    permitted, are then probed with a TCP connect to the configured ports.  An accepted or refused connection
+    both mean the host is up.
+
+    Attributes
+    ----------
+    concurrency: int
+        maximum number of probes in flight at one time
+    timeout: float
+        seconds to wait for a response from each probe
+    tcp_ports: list
+        tcp ports used for the connect fallback
+    icmp: bool
+        try icmp echo before falling back to tcp
+    """
+
+    def __init__(self, concurrency=512, timeout=2.0, tcp_ports=(22, 443), icmp=True):
+
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.tcp_ports = list(tcp_ports)
+        self.icmp = icmp
+
+    def sweep(self, network):
+        """ sweeps every address of the network and returns the ones that responded
+
+        Every address is swept, not just network.hosts(), so a network split into chunks still covers the addresses
+        that would be the network and broadcast address of each chunk.
+        Parameters
+        ----------
+            network:str
+                cidr network (or single ip address) to sweep
+
+        Returns
+        -------
+            list of live ip addresses as strings in ascending order
+        """
+
+        network = ipaddress.ip_network(network, strict=False)
+        hosts = [str(ip) for ip in network]
+
+        return asyncio.run(self.async_sweep(hosts))
+
+    async def async_sweep(self, hosts):
+        """ coroutine version of sweep for callers already running inside an event loop
+        Parameters
+        ----------
+            hosts:list
+                ip addresses as strings
+        """
+
+        live = set()
+
+        if self.icmp:
+            live |= await self._icmp_sweep(hosts)
+
+        remaining = [ip for ip in hosts if ip not in live]
+
+        if remaining and self.tcp_ports:
+            live |= await self._tcp_sweep(remaining)
+
+        return sorted(live, key=ipaddress.ip_address)
+
+    def _open_icmp_socket(self):
+        """ opens the icmp socket, returns (None, None) if icmp is not permitted for this process """
+
+        for sock_type in (socket.SOCK_DGRAM, socket.SOCK_RAW):
+            try:
+                sock = socket.socket(socket.AF_INET, sock_type, socket.IPPROTO_ICMP)
+            except OSError:
+                continue
+
+            sock.setblocking(False)
+            return sock, sock_type
+
+        return None, None
+
+    @staticmethod
+    def _checksum(data):
+
+        if len(data) % 2:
+            data += b"\x00"
+
+        total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+        total = (total >> 16) + (total & 0xFFFF)
+        total += total >> 16
+
+        return ~total & 0xFFFF
+
+    def _echo_request(self, identifier, sequence):
+
+        payload = struct.pack("!d", time.time())
+        header = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, 0, identifier, sequence)
+        checksum = self._checksum(header + payload)
+
+        return struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, checksum, identifier, sequence) + payload
+
+    async def _icmp_sweep(self, hosts):
+
+        sock, sock_type = self._open_icmp_socket()
+
+        if sock is None:
+            logging.info("icmp is not permitted for this process, sweeping with tcp connect only")
+            return set()
+
+        loop = asyncio.get_running_loop()
+        identifier = os.getpid() & 0xFFFF
+        targets = set(hosts)
+        live = set()
+        done = loop.create_future()
+
+        def on_readable():
+
+            # drain every reply that is waiting on the socket
+            while True:
+                try:
+                    packet, address = sock.recvfrom(1024)
+                except (BlockingIOError, InterruptedError):
+                    return
+                except OSError:
+                    return
+
+                # raw sockets include the ip header, datagram sockets do not
+                if sock_type == socket.SOCK_RAW:
+                    packet = packet[(packet[0] & 0x0F) * 4:]
+
+                if len(packet) < 8:
+                    continue
+
+                icmp_type, _, _, reply_id, _ = struct.unpack("!BBHHH", packet[:8])
+
+                # the kernel rewrites the identifier on datagram sockets so it is only checked on raw sockets
+                if icmp_type != ICMP_ECHO_REPLY:
+                    continue
+                if sock_type == socket.SOCK_RAW and reply_id != identifier:
+                    continue
+
+                if address[0] in targets:
+                    live.add(address[0])
+
+                    if len(live) == len(targets) and not done.done():
+                        done.set_result(True)
+
+        loop.add_reader(sock.fileno(), on_readable)
+
+        try:
+            sequence = itertools.count()
+
+            # send in batches of the concurrency size and yield to the loop so replies are drained in between
+            for start in range(0, len(hosts), self.concurrency):
+                for ip in hosts[start:start + self.concurrency]:
+                    packet = self._echo_request(identifier, next(sequence) & 0xFFFF)
+
+                    while True:
+                        try:
+                            sock.sendto(packet, (ip, 0))
+                            break
+                        except (BlockingIOError, InterruptedError):
+                            await asyncio.sleep(0.001)
+                        except OSError:
+                            break
+
+                await asyncio.sleep(0)
+
+            # wait for the stragglers, returning early if every host has answered
+            try:
+                await asyncio.wait_for(asyncio.shield(done), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                pass
+
+        finally:
+            loop.remove_reader(sock.fileno())
+            sock.close()
+
+        return live
+
+    async def _tcp_probe(self, ip, port):
+
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout=self.timeout)
+        except ConnectionRefusedError:
+            # a reset still means something answered at this address
+            return True
+        except (OSError, asyncio.TimeoutError):
+            return False
+
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+
+        return True
+
+    async def _tcp_sweep(self, hosts):
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def probe(ip):
+            for port in self.tcp_ports:
+                async with semaphore:
+                    if await self._tcp_probe(ip, port):
+                        return ip
+
+            return None
+
+        results = await asyncio.gather(*(probe(ip) for ip in hosts))
+
+        return {ip for ip in results if ip}
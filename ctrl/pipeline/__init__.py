@@ -0,0 +1,301 @@
+import asyncio
+import functools
+import ipaddress
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from models import ElasticIndex, EndpointCache, DeviceBusy
+from ..discover import Discover
+
+
+class Pipeline:
+    """ in-process discovery pipeline that streams hosts through bounded stages
+
+    ping -> detect -> index -> nmap / plugin details
+
+    The ssh session opened by the detect stage is kept and handed to the plugin in the details stage, so each device
+    is only logged into once.  The session keeps one login of the device lease until the details are done, so while
+    it waits in the queues it still counts against DEVICE_LEASE_LIMIT.
+
+    When a SweepCheckpoint is given, swept chunks and the hosts finishing each stage are recorded as they go.  Running
+    again with the same checkpoint skips the swept chunks and starts each live host at the first stage it has not
+    finished.
+
+    Every stage has its own worker count and a bounded queue in front of it, so a slow stage (usually detect or
+    details) fills its queue and makes the stages before it wait instead of piling up work in memory.  The ping stage
+    sweeps the network one chunk at a time for the same reason.  Blocking stages run in their own thread pool sized to
+    the stage's concurrency.
+
+    Attributes
+    ----------
+    appconfig: config.Config
+        environmental variables
+    discover: ctrl.Discover
+        discover object used by the ping, detect and nmap stages
+    queue_size: int
+        maximum number of hosts waiting in front of each stage
+    concurrency: dict
+        stage name to number of workers for that stage
+    nmap_batch: int
+        maximum number of hosts scanned by a single nmap invocation
+    """
+
+    def __init__(self, appconfig):
+
+        self.appconfig = appconfig
+        self.discover = Discover(appconfig)
+
+        self.elastic_host = appconfig.ELASTIC_HOST
+        self.elastic_port = appconfig.ELASTIC_PORT
+        self.endpoint_index = appconfig.ENDPOINT_INDEX
+        self.nmap_index = appconfig.NMAP_INDEX
+        self.nmap_enabled = appconfig.NMAP_ENABLED
+        self.endpoint_cache = EndpointCache.from_config(appconfig)
+        self.chunk_size = appconfig.SWEEP_CHUNK_SIZE
+
+        self.queue_size = appconfig.PIPELINE_QUEUE_SIZE
+        self.nmap_batch = appconfig.PIPELINE_NMAP_BATCH
+        self.concurrency = {
+            "detect": appconfig.PIPELINE_DETECT_CONCURRENCY,
+            "index": appconfig.PIPELINE_INDEX_CONCURRENCY,
+            "nmap": appconfig.PIPELINE_NMAP_CONCURRENCY,
+            "details": appconfig.PIPELINE_DETAILS_CONCURRENCY,
+        }
+
+    def run(self, network, checkpoint=None):
+        """ runs every host of the network through the pipeline and returns per stage counts
+        Parameters
+        ----------
+            network:str
+                cidr network (or single ip address) to discover
+            checkpoint:ctrl.discover.checkpoint.SweepCheckpoint
+                checkpoint to record progress in and resume from
+        """
+
+        return asyncio.run(self.async_run(network, checkpoint))
+
+    async def async_run(self, network, checkpoint=None):
+
+        self.checkpoint = checkpoint
+
+        self.stats = {"swept": 0, "live": 0, "detected": 0, "indexed": 0, "scanned": 0, "details": 0, "errors": 0}
+        self.executors = {name: ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"pipeline-{name}")
+                          for name, workers in self.concurrency.items()}
+
+        self.queues = {name: asyncio.Queue(maxsize=self.queue_size) for name in self.concurrency}
+
+        stages = {
+            "detect": self._detect,
+            "index": self._index,
+            "nmap": self._nmap,
+            "details": self._details,
+        }
+
+        workers = {name: [asyncio.create_task(self._worker(name, func)) for _ in range(self.concurrency[name])]
+                   for name, func in stages.items()}
+
+        try:
+            if checkpoint:
+                await self._resume()
+
+            await self._ping(network)
+
+            # drain the stages in order, a stage is only finished once everything upstream of it is finished
+            for name in ("detect", "index", "nmap", "details"):
+                await self.queues[name].join()
+
+                for task in workers[name]:
+                    task.cancel()
+                await asyncio.gather(*workers[name], return_exceptions=True)
+
+        finally:
+            for name in workers:
+                for task in workers[name]:
+                    task.cancel()
+
+            for executor in self.executors.values():
+                executor.shutdown(wait=False)
+
+            # sessions for records that never reached the details stage
+            self.discover.close_sessions()
+
+        logging.info(f"pipeline for {network} finished {self.stats}")
+
+        return self.stats
+
+    async def _ping(self, network):
+        """ sweeps the network one chunk at a time, waiting on the detect queue when it is full """
+
+        network = ipaddress.ip_network(network, strict=False)
+        new_prefix = max(network.prefixlen, network.max_prefixlen - (max(self.chunk_size, 1).bit_length() - 1))
+
+        chunks_done = await self._checkpoint("chunks_done") if self.checkpoint else set()
+
+        for chunk in network.subnets(new_prefix=new_prefix):
+            if str(chunk) in chunks_done:
+                continue
+
+            hosts = [str(ip) for ip in chunk]
+            live_ips = await self.discover.sweeper.async_sweep(hosts)
+
+            self.stats["swept"] += len(hosts)
+            self.stats["live"] += len(live_ips)
+
+            if live_ips:
+                # warm the resolver cache for the whole chunk before the detect stage asks for each host
+                await self._blocking("detect", self.discover.resolver.resolve_many, live_ips)
+
+            for ip in live_ips:
+                await self.queues["detect"].put(ip)
+
+            await self._checkpoint("chunk_done", str(chunk), live_ips)
+
+    async def _resume(self):
+        """ puts each live host from the checkpoint back in at the first stage it has not finished """
+
+        live = await self._checkpoint("live")
+        detected = await self._checkpoint("completed", "device_info")
+        scanned = await self._checkpoint("completed", "nmap")
+        detailed = await self._checkpoint("completed", "details")
+        records = await self._checkpoint("records", live & detected)
+
+        for ip in sorted(live, key=ipaddress.ip_address):
+            if ip not in records:
+                await self.queues["detect"].put(ip)
+                continue
+
+            record = records[ip]
+
+            if self.nmap_enabled and ip not in scanned:
+                await self.queues["nmap"].put(record)
+
+            if record['device_type'] in self.appconfig.PLUGIN_MODS and ip not in detailed:
+                await self.queues["details"].put(record)
+
+    async def _checkpoint(self, method, *args):
+        """ calls the checkpoint method off the event loop, does nothing without a checkpoint """
+
+        if not self.checkpoint:
+            return None
+
+        loop = asyncio.get_running_loop()
+
+        return await loop.run_in_executor(None, getattr(self.checkpoint, method), *args)
+
+    async def _worker(self, name, func):
+
+        queue = self.queues[name]
+
+        while True:
+            item = await queue.get()
+
+            try:
+                await func(item)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["errors"] += 1
+                logging.error(f"pipeline {name} stage failed for {item} due to {e}")
+            finally:
+                queue.task_done()
+
+    async def _blocking(self, name, func, *args):
+
+        loop = asyncio.get_running_loop()
+
+        return await loop.run_in_executor(self.executors[name], func, *args)
+
+    async def _detect(self, ip):
+
+        # detection logs in under the device lease, a device another task is using is tried again once it is free
+        for attempt in range(self.appconfig.DEVICE_LEASE_RETRIES + 1):
+            try:
+                record = await self._blocking("detect", self.discover.device_info, ip, True)
+                break
+            except DeviceBusy:
+                if attempt == self.appconfig.DEVICE_LEASE_RETRIES:
+                    raise
+
+                await asyncio.sleep(self.appconfig.DEVICE_LEASE_RETRY_DELAY)
+        record['update_time'] = str(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+
+        self.stats["detected"] += 1
+        await self.queues["index"].put(record)
+
+    async def _index(self, record):
+
+        index = ElasticIndex(self.endpoint_index, host=self.elastic_host, port=self.elastic_port)
+        record = await self._blocking("index", index.add_document, record, "wait_for")
+        await self._blocking("index", self.endpoint_cache.invalidate, record['hostname'])
+
+        self.stats["indexed"] += 1
+        await self._checkpoint("complete", "device_info", [record['ip']], [record])
+
+        if self.nmap_enabled:
+            await self.queues["nmap"].put(record)
+
+        if record['device_type'] in self.appconfig.PLUGIN_MODS:
+            await self.queues["details"].put(record)
+        else:
+            self.discover.discard_session(record['ip'])
+
+    async def _nmap(self, record):
+
+        # gather whatever else is already waiting so one nmap invocation covers as many hosts as possible
+        records = {record['ip']: record}
+        queue = self.queues["nmap"]
+
+        while len(records) < self.nmap_batch and not queue.empty():
+            waiting = queue.get_nowait()
+            records[waiting['ip']] = waiting
+            queue.task_done()
+
+        hostnames = {ip: r['hostname'] for ip, r in records.items()}
+        scans = await self._blocking("nmap", self.discover.nmap_info_many, list(records), hostnames)
+
+        index = ElasticIndex(self.nmap_index, host=self.elastic_host, port=self.elastic_port)
+        for ip, scan_info in scans.items():
+            scan_info['endpoint_id'] = records[ip]['_id']
+
+        ids, errors = await self._blocking("nmap", index.add_documents, list(scans.values()), 500, "wait_for")
+        for error in errors:
+            logging.error(f"failed to record nmap info for {error['doc']['hostname']} due to {error['error']}")
+
+        await self._blocking("nmap", self.endpoint_cache.invalidate, *hostnames.values())
+
+        scanned = [ip for ip, doc_id in zip(scans, ids) if doc_id]
+        self.stats["scanned"] += len(scanned)
+        await self._checkpoint("complete", "nmap", scanned)
+
+    async def _details(self, record):
+
+        plugin_module = self.appconfig.PLUGINS[record['device_type']]
+        session = self.discover.pop_session(record['ip'])
+        lease = self.discover.pop_lease(record['ip'])
+
+        if session is None and lease is not None:
+            lease.release()
+            lease = None
+
+        try:
+            # the plugin runs under the lease the session was kept with, without one it leases the device itself and
+            # another task holding the device only delays the details until it is free
+            for attempt in range(self.appconfig.DEVICE_LEASE_RETRIES + 1):
+                details = functools.partial(plugin_module.record_details, record, self.appconfig, session,
+                                            lease=lease)
+                try:
+                    await self._blocking("details", details)
+                    break
+                except DeviceBusy:
+                    if attempt == self.appconfig.DEVICE_LEASE_RETRIES:
+                        raise
+
+                    await asyncio.sleep(self.appconfig.DEVICE_LEASE_RETRY_DELAY)
+        finally:
+            self.discover.close_session(session)
+            if lease is not None:
+                lease.release()
+
+        self.stats["details"] += 1
+        await self._checkpoint("complete", "details", [record['ip']])
@@ -1,7 +1,7 @@
-from models import ElasticIndex
+from models import ElasticIndex, EndpointCache
 from redis import Redis
 from rq import Queue
-from datetime import datetime
+from rq.job import Job
 
 class Retrieve:
     def __init__(self, appconfig):
@@ -14,24 +14,27 @@ class Retrieve:
         self.vlan_index = appconfig.VLAN_INDEX
         self.gateway_index = appconfig.GATEWAY_INDEX
         self.zone_index = appconfig.ZONE_INDEX
+        self.ep_details_index = appconfig.EP_DETAILS_INDEX
         self.redis_host = appconfig.REDIS_HOST
         self.redis_port = appconfig.REDIS_PORT
+        self.redis_connection = Redis(host=self.redis_host, port=self.redis_port, db=0)
         self.nmap_enabled = appconfig.NMAP_ENABLED
+        self.endpoint_cache = EndpointCache.from_config(appconfig)
+        # the search pages render at most this many hits, exports stream every hit with query_csv
+        self.search_size = appconfig.SEARCH_RESULT_SIZE
 
     def endpoint_info_query(self, query):
 
         index = ElasticIndex(self.endpoint_index, host=self.elastic_host, port=self.elastic_port)
-        elastic_hits = index.lquery(query, exact_match=False)
+        hits, total = index.search_sources(query, size=self.search_size)
 
-        if len(elastic_hits['hits']['hits']) > 0:
-            hits = []
-            for eh in elastic_hits['hits']['hits']:
-                hits.append(eh['_source'])
+        if len(hits) > 0:
 
             # TODO determine if the headers and data keys are even needed.  this was a leftover from how the tasks card works
             device_query = {"headers": ["Hostname", "IP Address", "Device Type"],
                             "data_keys": ["hostname", "ip", "device_type"],
-                            "data": hits}
+                            "data": hits,
+                            "total": total}
             return device_query
         else:
             return None
@@ -39,267 +42,358 @@ class Retrieve:
     def nmap_info_query(self, query):
 
         index = ElasticIndex(self.nmap_index, host=self.elastic_host, port=self.elastic_port)
-        elastic_hits = index.lquery(query, exact_match=False)
+        hits, total = index.search_sources(query, size=self.search_size)
 
-        if len(elastic_hits['hits']['hits']) > 0:
-            hits = []
-            for eh in elastic_hits['hits']['hits']:
-                hits.append(eh['_source'])
-
-            return hits
+        if len(hits) > 0:
+            return {"data": hits, "total": total}
         else:
             return None
 
     def vlan_info_query(self, query):
 
         index = ElasticIndex(self.vlan_index, host=self.elastic_host, port=self.elastic_port)
-        elastic_hits = index.lquery(query, exact_match=False)
-
-        if len(elastic_hits['hits']['hits']) > 0:
-            hits = []
-            for eh in elastic_hits['hits']['hits']:
-                hits.append(eh['_source'])
+        hits, total = index.search_sources(query, size=self.search_size)
 
-            return hits
+        if len(hits) > 0:
+            return {"data": hits, "total": total}
         else:
             return None
 
-    def endpoint_all(self, hostname):
+    def query_csv(self, query, query_type="endpoint"):
+        """ streams the results of a search as csv lines, one page of hits is held in memory at a time
+        Parameters
+        ----------
+            query:str
+                lucene query string
+            query_type:str
+                endpoint, nmap or vlan
+        """
 
-        info = self.endpoint_info(hostname)
-        device = {}
+        index_name, data_keys = {
+            "endpoint": (self.endpoint_index, ["hostname", "ip", "device_type", "update_time"]),
+            "nmap": (self.nmap_index, ["hostname", "@timestamp"]),
+            "vlan": (self.vlan_index, ["hostname", "number", "name"]),
+        }[query_type]
 
-        if info:
-            device['info'] = info
-        else:
-            return None
+        index = ElasticIndex(index_name, host=self.elastic_host, port=self.elastic_port)
+
+        yield ",".join(data_keys) + "\n"
 
-        if self.nmap_enabled:
-            nmap_info = self.nmap_info(device['info']['_id'])
-            if nmap_info:
-                device['nmap_info'] = nmap_info
+        for hit in index.iter_lquery(query, exact_match=False):
+            yield ",".join(str(hit.get(key, '')).replace(',', '') for key in data_keys) + "\n"
 
-        details = self.detail_info(device['info']['_id'])
-        if details:
-            device['details'] = details
+    def endpoint_all(self, hostname):
+        """ returns everything recorded for the endpoint, from the endpoint cache when it is there """
 
-        vlan_info = self.vlan_info(hostname)
-        if vlan_info:
-            device['vlan_info'] = vlan_info
+        hostname = hostname.replace('"', '')
 
-        interface_info = self.interface_info(hostname)
-        if interface_info:
-            device['interface_info'] = interface_info
+        device = self.endpoint_cache.get(hostname)
 
-        gateway_info = self.gateway_info(hostname)
-        if gateway_info:
-            device['gateway_info'] = gateway_info
+        if device is None:
+            device = self.endpoint_search(hostname)
 
-        zone_info = self.zone_info(hostname)
-        if zone_info:
-            device['zone_info'] = zone_info
+            if device:
+                self.endpoint_cache.set(hostname, device)
 
         return device
 
-    def endpoint_info(self,hostname):
+    def endpoint_search(self, hostname):
+        """ returns everything recorded for the endpoint with a single _msearch request
+
+        Every document is looked up by hostname so nothing has to wait on the endpoint's id, the newest scan and
+        details recorded for the hostname are returned.  Indices that do not exist are skipped.
+        """
+
+        matches = {"hostname": hostname}
+
+        lookups = {
+            "info": {"index": self.endpoint_index, "matches": matches, "size": 1},
+            "nmap_info": {"index": self.nmap_index, "matches": matches, "size": 1, "sort_field": "@timestamp",
+                          "sort_order": "desc"},
+            "details": {"index": self.ep_details_index, "matches": matches, "size": 1, "sort_field": "@timestamp",
+                        "sort_order": "desc"},
+            "vlan_info": {"index": self.vlan_index, "matches": matches},
+            "interface_info": {"index": self.interface_index, "matches": matches},
+            "gateway_info": {"index": self.gateway_index, "matches": matches},
+            "zone_info": {"index": self.zone_index, "matches": matches},
+        }
+
+        if not self.nmap_enabled:
+            del lookups['nmap_info']
 
         index = ElasticIndex(self.endpoint_index, host=self.elastic_host, port=self.elastic_port)
+        results = dict(zip(lookups, index.lookup_many(list(lookups.values()))))
 
-        if not index.es.indices.exists(index=index.index):
+        if not results['info']:
             return None
 
-        elastic_hits = index.lquery(hostname, field="hostname")
+        device = {
+            'info': results['info'][0],
+            'nmap_info': results['nmap_info'][0] if results.get('nmap_info') else None,
+            'details': results['details'][0] if results['details'] else None,
+            'vlan_info': self._keyed(results['vlan_info'], 'number'),
+            'interface_info': self._keyed(results['interface_info'], 'name'),
+            'gateway_info': self._keyed(results['gateway_info'], 'gateway-name'),
+            'zone_info': self._keyed(results['zone_info'], 'name', remove_key=False),
+        }
 
-        if elastic_hits['hits']['total']['value'] == 0:
-            return None
+        return {key: value for key, value in device.items() if value}
 
-        info = None
+    @staticmethod
+    def _keyed(hits, key, remove_key=True):
+        """ returns the hits as a dictionary keyed by one of their fields, hits without the field are skipped since
+        two kinds of document can share an index (ex gateways and interfaces) """
 
-        for eh in elastic_hits['hits']['hits']:
+        keyed = {}
 
-            if eh["_source"]['hostname'] == hostname.replace('"', ''):
-                info = eh["_source"]
-                info['_id'] = eh['_id']
-                break
+        for hit in hits:
+            if key not in hit:
+                continue
+
+            keyed[hit[key]] = hit
+            if remove_key:
+                del hit[key]
+
+        return keyed or None
+
+    def endpoint_info(self,hostname):
+
+        index = ElasticIndex(self.endpoint_index, host=self.elastic_host, port=self.elastic_port)
+
+        if not index.exists():
+            return None
+
+        hits = index.lookup({"hostname": hostname.replace('"', '')}, size=1)
+
+        if not hits:
+            return None
 
-        return info
+        return hits[0]
 
     def nmap_info(self, endpoint_id):
 
         index = ElasticIndex(self.nmap_index, host=self.elastic_host, port=self.elastic_port)
 
-        if not index.es.indices.exists(index=index.index):
+        if not index.exists():
             return None
 
         try:
-            elastic_hits = index.query(endpoint_id, field="endpoint_id", sort_field="@timestamp", sort_order="desc")
+            hits = index.lookup({"endpoint_id": endpoint_id}, size=1, sort_field="@timestamp", sort_order="desc")
         except:
             return None
 
-        if elastic_hits['hits']['total']['value'] == 0:
+        if not hits:
             return None
 
-        nmap_info = elastic_hits['hits']['hits'][0]["_source"]
-        nmap_info['_id'] = elastic_hits['hits']['hits'][0]['_id']
-
-        return nmap_info
+        return hits[0]
 
     def detail_info(self, endpoint_id):
 
-        index = ElasticIndex("ep_details", host=self.elastic_host, port=self.elastic_port)
+        index = ElasticIndex(self.ep_details_index, host=self.elastic_host, port=self.elastic_port)
 
-        if not index.es.indices.exists(index=index.index):
+        if not index.exists():
             return None
 
         try:
-            elastic_hits = index.query(endpoint_id, field="endpoint_id")
+            hits = index.lookup({"endpoint_id": endpoint_id}, size=1)
         except:
             return None
 
-        if elastic_hits['hits']['total']['value'] == 0:
+        if not hits:
             return None
 
-        details = elastic_hits['hits']['hits'][0]["_source"]
-        details['_id'] = elastic_hits['hits']['hits'][0]['_id']
-
-        return details
+        return hits[0]
 
 
     def interface_info(self, hostname):
         index = ElasticIndex(self.interface_index, host=self.elastic_host, port=self.elastic_port)
 
-        if not index.es.indices.exists(index=index.index):
+        if not index.exists():
             return None
 
-        elastic_hits = index.query(hostname, field="hostname")
+        hits = index.lookup({"hostname": hostname.replace('"', '')})
 
-        if elastic_hits['hits']['total']['value'] == 0:
+        if not hits:
             return None
 
-        interface_info = {}
-
-        for eh in elastic_hits['hits']['hits']:
-
-            try:
-                if eh["_source"]['hostname'] == hostname.replace('"', ''):
-                    interface = eh["_source"]
-                    interface['_id'] = eh['_id']
-                    interface_name = interface['name']
-                    del interface['name']
-                    interface_info[interface_name] = interface
-            except:
-                return None
-
-        return interface_info
+        return self._keyed(hits, 'name')
 
 
     def vlan_info(self, hostname):
         index = ElasticIndex(self.vlan_index, host=self.elastic_host, port=self.elastic_port)
 
-        if not index.es.indices.exists(index=index.index):
+        if not index.exists():
             return None
 
-        elastic_hits = index.query(hostname, field="hostname")
+        hits = index.lookup({"hostname": hostname.replace('"', '')})
 
-        if elastic_hits['hits']['total']['value'] == 0:
+        if not hits:
             return None
 
-        vlan_info = {}
-
-        for eh in elastic_hits['hits']['hits']:
-
-            if eh["_source"]['hostname'] == hostname.replace('"', ''):
-                vlan = eh["_source"]
-                vlan['_id'] = eh['_id']
-                vlan_name = vlan['number']
-                del vlan['number']
-                vlan_info[vlan_name] = vlan
-
-        return vlan_info
+        return self._keyed(hits, 'number')
 
     def gateway_info(self, hostname):
         index = ElasticIndex(self.gateway_index, host=self.elastic_host, port=self.elastic_port)
 
-        if not index.es.indices.exists(index=index.index):
+        if not index.exists():
             return None
 
-        elastic_hits = index.query(hostname, field="hostname")
+        hits = index.lookup({"hostname": hostname.replace('"', '')})
 
-        if elastic_hits['hits']['total']['value'] == 0:
+        if not hits:
             return None
 
-        gw_info = {}
-
-        for eh in elastic_hits['hits']['hits']:
-
-            if eh["_source"]['hostname'] == hostname.replace('"', ''):
-                gw = eh["_source"]
-                gw['_id'] = eh['_id']
-                name = gw['gateway-name']
-                del gw['gateway-name']
-                gw_info[name] = gw
-
-        return gw_info
+        return self._keyed(hits, 'gateway-name')
 
     def zone_info(self, hostname):
         index = ElasticIndex(self.zone_index, host=self.elastic_host, port=self.elastic_port)
 
-        if not index.es.indices.exists(index=index.index):
+        if not index.exists():
             return None
 
-        elastic_hits = index.query(hostname, field="hostname")
+        hits = index.lookup({"hostname": hostname.replace('"', '')})
 
-        if elastic_hits['hits']['total']['value'] == 0:
+        if not hits:
             return None
 
-        zone_info = {}
+        return self._keyed(hits, 'name', remove_key=False)
 
-        for eh in elastic_hits['hits']['hits']:
+    def jobs_all(self, queue_name):
 
-            if eh["_source"]['hostname'] == hostname.replace('"', ''):
-                z = eh["_source"]
-                z['_id'] = eh['_id']
-                name = z['name']
-                zone_info[name] = z
+        return list(self.jobs_iter(queue_name))
+
+    def job_queue(self, queue_name):
+        """ returns the queue and a dictionary of status to the queue or registry holding jobs in that status """
+
+        queue = Queue(connection=self.redis_connection, name=queue_name)
+
+        sources = {
+            "queued": queue,
+            "started": queue.started_job_registry,
+            "finished": queue.finished_job_registry,
+            "failed": queue.failed_job_registry,
+            "deferred": queue.deferred_job_registry,
+            "scheduled": queue.scheduled_job_registry,
+        }
+
+        return queue, sources
+
+    def job_counts(self, queue_name):
+        """ returns the number of jobs in each status with one pipelined round trip """
+
+        queue, sources = self.job_queue(queue_name)
+
+        with self.redis_connection.pipeline() as pipe:
+            for status, source in sources.items():
+                if status == "queued":
+                    pipe.llen(source.key)
+                else:
+                    pipe.zcard(source.key)
+            counts = pipe.execute()
+
+        return dict(zip(sources, counts))
+
+    def jobs(self, queue_name, status=None, page=1, page_size=100):
+        """ returns one page of the jobs in the queue and its registries
+        Parameters
+        ----------
+            queue_name:str
+                name of the rq queue
+            status:str
+                only list jobs in this status (queued, started, finished, failed, deferred or scheduled)
+            page:int
+                page number starting at 1
+            page_size:int
+                number of jobs per page
+
+        Returns
+        -------
+            {"counts": status to number of jobs, "total": number of jobs matching the status filter, "page", "pages",
+             "data": list of job dictionaries}
+        """
+
+        queue, sources = self.job_queue(queue_name)
+        counts = self.job_counts(queue_name)
+
+        statuses = [status] if status in sources else list(sources)
+        total = sum(counts.get(s, 0) for s in statuses)
+        page = max(int(page), 1)
+
+        # walk the statuses in order, taking the part of each one that falls inside the page
+        start = (page - 1) * page_size
+        remaining = page_size
+        ids = []
+
+        for s in statuses:
+            if remaining <= 0:
+                break
 
-        return zone_info
+            if start >= counts[s]:
+                start -= counts[s]
+                continue
 
-    def jobs_all(self, queue_name):
+            if s == "queued":
+                page_ids = sources[s].get_job_ids(offset=start, length=remaining)
+            else:
+                page_ids = sources[s].get_job_ids(start=start, end=start + remaining - 1)
 
-        redis_connection = Redis(host=self.redis_host, port=self.redis_port, db=0)
+            ids.extend((job_id, s) for job_id in page_ids)
+            remaining -= len(page_ids)
+            start = 0
 
-        queue = Queue(connection=redis_connection, name=queue_name)
+        return {
+            "counts": counts,
+            "total": total,
+            "page": page,
+            "pages": max((total + page_size - 1) // page_size, 1),
+            "data": self.fetch_jobs(ids),
+        }
 
-        regs = [queue.started_job_registry,
-                queue.finished_job_registry,
-                queue.failed_job_registry,
-                queue.deferred_job_registry,
-                queue.scheduled_job_registry]
+    def jobs_iter(self, queue_name, status=None, page_size=500):
+        """ yields every job in the queue and its registries, fetched one page at a time """
 
-        job_ids = queue.get_job_ids()
+        page = 1
 
-        for reg in regs:
-            job_ids += reg.get_job_ids()
+        while True:
+            result = self.jobs(queue_name, status=status, page=page, page_size=page_size)
 
-        job_data = []
-        for job_id in job_ids:
-            job = queue.fetch_job(job_id)
+            yield from result['data']
 
-            job_dict = job.to_dict()
-            job_dict['job_id'] = job_id
-            job_dict['created_at'] = self.convert_redis_time(job_dict['created_at'])
-            job_dict['enqueued_at'] = self.convert_redis_time(job_dict['enqueued_at'])
-            job_dict['started_at'] = self.convert_redis_time(job_dict['started_at'])
-            job_dict['ended_at'] = self.convert_redis_time(job_dict['ended_at'])
-            job_data.append(job_dict)
+            if page >= result['pages']:
+                break
+            page += 1
 
-        return job_data
+    def fetch_jobs(self, ids):
+        """ fetches the jobs in one pipelined round trip with Job.fetch_many
+        Parameters
+        ----------
+            ids:list
+                (job_id, status) pairs, the status is the registry the id was read from
+        """
 
-    def convert_redis_time(self, redis_time):
+        jobs = Job.fetch_many([job_id for job_id, _ in ids], connection=self.redis_connection)
 
-        try:
-            standard_time = str(datetime.strptime(redis_time, "%Y-%m-%dT%H:%M:%S.%f%z").strftime("%Y-%m-%d %H:%M:%S"))
-        except:
-            standard_time = redis_time
+        job_data = []
+        for (job_id, status), job in zip(ids, jobs):
+
+            # the job expired between reading the registry and fetching it
+            if job is None:
+                continue
+
+            job_data.append({
+                "job_id": job_id,
+                "description": job.description,
+                "status": status,
+                "created_at": self.format_time(job.created_at),
+                "enqueued_at": self.format_time(job.enqueued_at),
+                "started_at": self.format_time(job.started_at),
+                "ended_at": self.format_time(job.ended_at),
+                "finished_at": self.format_time(job.ended_at),
+            })
+
+        return job_data
+
+    @staticmethod
+    def format_time(value):
 
-        return standard_time
\ No newline at end of file
+        return value.strftime("%Y-%m-%d %H:%M:%S") if value else None
@@ -0,0 +1,202 @@
+import logging
+import math
+import multiprocessing
+import signal
+import time
+
+from redis import Redis
+from rq import Queue, Worker
+
+
+def run_worker(queue_name, redis_host, redis_port):
+    """ target of each worker process, runs one rq worker (with the scheduler) on the queue until it is stopped """
+
+    from models import ElasticClients
+
+    # the child must not share the parent's elasticsearch sockets
+    ElasticClients.clear()
+
+    redis_connection = Redis(host=redis_host, port=redis_port, db=0)
+    worker = Worker([Queue(queue_name, connection=redis_connection)], connection=redis_connection)
+
+    worker.work(with_scheduler=True)
+
+
+class WorkerSupervisor:
+    """ runs a pool of rq worker processes per queue and sizes each pool to its backlog
+
+    Every interval the supervisor reads the length of each queue and the size of its started registry in one
+    pipelined round trip, and wants one worker per WORKER_JOBS_PER_WORKER jobs, between WORKER_MIN and WORKER_MAX.
+    Pools grow straight away but only shrink once they have wanted fewer workers for WORKER_SCALE_DOWN_DELAY seconds,
+    and a worker being scaled down gets SIGTERM so rq lets it finish its current job first.  A worker that exits
+    without being asked to is logged and replaced.
+
+    On SIGTERM every worker is sent one SIGTERM and waited on.  On SIGINT (ctrl-c) the terminal has already sent
+    SIGINT to the whole process group, so the workers are only waited on, a second signal would make rq kill the jobs
+    they are running.
+
+    Attributes
+    ----------
+    appconfig: config.Config
+        environmental variables
+    queues: list
+        names of the queues to run workers for
+    workers: dict
+        queue name to the list of its running worker processes
+    """
+
+    def __init__(self, appconfig):
+
+        self.appconfig = appconfig
+        self.redis_host = appconfig.REDIS_HOST
+        self.redis_port = appconfig.REDIS_PORT
+        self.redis_connection = Redis(host=self.redis_host, port=self.redis_port, db=0)
+
+        self.queues = list(appconfig.WORKER_QUEUES)
+        self.min_workers = appconfig.WORKER_MIN
+        self.max_workers = appconfig.WORKER_MAX
+        self.jobs_per_worker = appconfig.WORKER_JOBS_PER_WORKER
+        self.interval = appconfig.WORKER_SCALE_INTERVAL
+        self.scale_down_delay = appconfig.WORKER_SCALE_DOWN_DELAY
+
+        self.workers = {name: [] for name in self.queues}
+        # workers asked to stop, to the name of their queue
+        self.stopping = {}
+        self.below_since = {}
+        self.running = False
+        self.stop_signal = None
+
+    def run(self):
+        """ supervises the workers until the process receives SIGINT or SIGTERM, then stops every worker """
+
+        self.running = True
+
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGTERM, self._stop)
+
+        logging.info(f"supervising workers for {', '.join(self.queues)}")
+
+        try:
+            while self.running:
+                self.reap()
+                self.scale(self.depth())
+                time.sleep(self.interval)
+        finally:
+            self.shutdown()
+
+    def _stop(self, signum, frame):
+
+        self.running = False
+        self.stop_signal = signum
+
+    def depth(self):
+        """ returns a dictionary of queue name to the number of queued plus started jobs """
+
+        queues = [Queue(name, connection=self.redis_connection) for name in self.queues]
+
+        with self.redis_connection.pipeline() as pipe:
+            for queue in queues:
+                pipe.llen(queue.key)
+                pipe.zcard(queue.started_job_registry.key)
+            counts = pipe.execute()
+
+        return {name: counts[i * 2] + counts[i * 2 + 1] for i, name in enumerate(self.queues)}
+
+    def desired(self, jobs):
+        """ number of workers wanted for a queue with the given number of queued plus started jobs """
+
+        wanted = math.ceil(jobs / max(self.jobs_per_worker, 1))
+
+        return max(self.min_workers, min(self.max_workers, wanted))
+
+    def scale(self, depth):
+
+        for name in self.queues:
+            running = len(self.workers[name])
+            wanted = self.desired(depth.get(name, 0))
+
+            if wanted >= running:
+                self.below_since.pop(name, None)
+
+                for _ in range(wanted - running):
+                    self.start_worker(name)
+
+                continue
+
+            # only shrink once the pool has been too big for the whole delay
+            since = self.below_since.setdefault(name, time.monotonic())
+            if time.monotonic() - since < self.scale_down_delay:
+                continue
+
+            for _ in range(running - wanted):
+                self.stop_worker(name)
+
+            self.below_since.pop(name, None)
+
+    def start_worker(self, queue_name):
+
+        process = multiprocessing.Process(target=run_worker, args=(queue_name, self.redis_host, self.redis_port),
+                                          name=f"worker-{queue_name}", daemon=False)
+        process.start()
+        self.workers[queue_name].append(process)
+
+        logging.info(f"started {queue_name} worker {process.pid}, {len(self.workers[queue_name])} running")
+
+    def stop_worker(self, queue_name, signal_worker=True):
+        """ asks the newest worker of the queue to finish its current job and exit
+        Parameters
+        ----------
+            queue_name:str
+                name of the queue
+            signal_worker:bool
+                send the worker SIGTERM, false when it has already been signalled
+        """
+
+        process = self.workers[queue_name].pop()
+        self.stopping[process] = queue_name
+
+        if signal_worker:
+            process.terminate()
+
+        logging.info(f"stopping {queue_name} worker {process.pid}, {len(self.workers[queue_name])} running")
+
+    def reap(self):
+        """ drops workers that have exited, the next scale replaces any that were not asked to stop """
+
+        for name in self.queues:
+            for process in [p for p in self.workers[name] if not p.is_alive()]:
+                self.workers[name].remove(process)
+                process.join()
+                self.log_exit(name, process, stopped=False)
+
+        for process in [p for p in self.stopping if not p.is_alive()]:
+            process.join()
+            self.log_exit(self.stopping.pop(process), process, stopped=True)
+
+    @staticmethod
+    def log_exit(queue_name, process, stopped):
+
+        if process.exitcode == 0 and stopped:
+            logging.info(f"{queue_name} worker {process.pid} stopped")
+        elif process.exitcode == 0:
+            logging.info(f"{queue_name} worker {process.pid} exited, replacing it")
+        elif stopped:
+            logging.warning(f"{queue_name} worker {process.pid} stopped with exit code {process.exitcode}")
+        else:
+            logging.warning(f"{queue_name} worker {process.pid} crashed with exit code {process.exitcode}, "
+                            f"replacing it")
+
+    def shutdown(self):
+
+        # ctrl-c already reached every worker through the process group
+        signal_workers = self.stop_signal != signal.SIGINT
+
+        for name in self.queues:
+            while self.workers[name]:
+                self.stop_worker(name, signal_worker=signal_workers)
+
+        for process in list(self.stopping):
+            process.join()
+            self.log_exit(self.stopping.pop(process), process, stopped=True)
+
+        logging.info("every worker stopped")
@@ -1,8 +1,15 @@
+import json
+import uuid
+from datetime import datetime
+
 from redis import Redis
 from rq import Queue
+from rq.job import Job
+
+from models import ElasticIndex
 
-from .actions import rediscover_device_info, rediscover_nmap_info, rediscover_vlan_info, remove_endpoint_info, \
-    rediscover_interface_info
+from . import jobs
+from .dedupe import JobDedupe
 
 
 class TaskMgr:
@@ -11,42 +18,126 @@ class TaskMgr:
         redis_host = appconfig.REDIS_HOST
         redis_port = appconfig.REDIS_PORT
         redids_connection = Redis(host=redis_host, port=redis_port, db=0)
+        self.redis_connection = redids_connection
         self.high_queue = Queue(connection=redids_connection, name='high')
         
         self.appconfig = appconfig
+        self.batch_ttl = appconfig.TASK_BATCH_TTL
+        self.dedupe = JobDedupe(redids_connection, ttl=appconfig.TASK_DEDUPE_TTL)
 
-    def rediscover_device_info(self,record):
+        # action name to the description prefix of its jobs, the tasks themselves are in jobs.ACTIONS
+        self.actions = {
+            "device_info": "Rediscover info",
+            "nmap_info": "Rediscover nmap",
+            "vlan_info": "Rediscover vlan",
+            "interface_info": "Rediscover interfaces",
+            "remove": "Delete",
+        }
+
+    def enqueue(self, action, record, options=None):
+        """ enqueues the action for the record, the job only carries the action, endpoint id and options
+
+        If the same action is already queued or running for the device's ip that job is returned instead.
+        """
 
-        job = self.high_queue.enqueue(rediscover_device_info.run,
-                                   args=(record,self.appconfig,),
-                                   description=f"Rediscover info {record['ip']}")
+        job = self.dedupe.enqueue(self.high_queue, action, record['ip'], jobs.run,
+                                  args=(action, record['_id'], options,),
+                                  description=f"{self.actions[action]} {record['ip']}")
         return job
 
+    def rediscover_device_info(self,record):
+
+        return self.enqueue("device_info", record)
+
     def rediscover_nmap_info(self,record):
 
-        job = self.high_queue.enqueue(rediscover_nmap_info.run,
-                                   args=(record,self.appconfig,),
-                                   description=f"Rediscover nmap {record['ip']}")
-        return job
+        return self.enqueue("nmap_info", record)
 
     def rediscover_vlan_info(self,record):
 
-        job = self.high_queue.enqueue(rediscover_vlan_info.run,
-                                   args=(record,self.appconfig,),
-                                   description=f"Rediscover vlan {record['ip']}")
-        return job
+        return self.enqueue("vlan_info", record)
 
     def rediscover_interface_info(self,record):
 
-        job = self.high_queue.enqueue(rediscover_interface_info.run,
-                                   args=(record,self.appconfig,),
-                                   description=f"Rediscover interfaces {record['ip']}")
-        return job
+        return self.enqueue("interface_info", record)
 
     def remove_endpoint_info(self, record):
 
-        job = self.high_queue.enqueue(remove_endpoint_info.run,
-                                   args=(record, self.appconfig,),
-                                   description=f"Delete {record['ip']}")
+        return self.enqueue("remove", record)
+
+    def batch(self, action, records):
+        """ enqueues the action for every record in one redis pipeline and returns the batch id
+        Parameters
+        ----------
+            action:str
+                one of device_info, nmap_info, vlan_info, interface_info or remove
+            records:list
+                endpoint records, each with its _id
+        """
+
+        description = self.actions[action]
+        batch_id = uuid.uuid4().hex
+        records = list(records)
+
+        job_datas = [Queue.prepare_data(jobs.run, args=(action, record['_id'], None,),
+                                        description=f"{description} {record['ip']}") for record in records]
+
+        with self.redis_connection.pipeline() as pipe:
+            # devices that already have the action queued or running keep their job, which joins the batch
+            enqueued = self.dedupe.enqueue_many(self.high_queue, job_datas,
+                                                [(action, record['ip']) for record in records], pipeline=pipe)
+
+            meta = {"action": action, "count": len(enqueued),
+                    "created": str(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))}
+            pipe.set(self.batch_key(batch_id, "meta"), json.dumps(meta), ex=self.batch_ttl)
+            if enqueued:
+                pipe.rpush(self.batch_key(batch_id, "jobs"), *[job.id for job in enqueued])
+                pipe.expire(self.batch_key(batch_id, "jobs"), self.batch_ttl)
+
+            pipe.execute()
+
+        return batch_id
+
+    def batch_by_query(self, action, query):
+        """ enqueues the action for every endpoint matching the search query, returns the batch id """
+
+        index = ElasticIndex(self.appconfig.ENDPOINT_INDEX, host=self.appconfig.ELASTIC_HOST,
+                             port=self.appconfig.ELASTIC_PORT)
+
+        return self.batch(action, index.iter_lquery(query, exact_match=False))
+
+    def batch_by_ids(self, action, endpoint_ids):
+        """ enqueues the action for every endpoint id that exists, returns the batch id """
+
+        index = ElasticIndex(self.appconfig.ENDPOINT_INDEX, host=self.appconfig.ELASTIC_HOST,
+                             port=self.appconfig.ELASTIC_PORT)
+
+        return self.batch(action, index.get_documents(endpoint_ids))
+
+    def batch_status(self, batch_id):
+        """ returns the batch information with the number of its jobs in each status, None if it has expired """
+
+        with self.redis_connection.pipeline() as pipe:
+            pipe.get(self.batch_key(batch_id, "meta"))
+            pipe.lrange(self.batch_key(batch_id, "jobs"), 0, -1)
+            meta, job_ids = pipe.execute()
+
+        if meta is None:
+            return None
+
+        statuses = {}
+        for job in Job.fetch_many([job_id.decode() for job_id in job_ids], connection=self.redis_connection):
+            status = job.get_status(refresh=False) if job else "expired"
+            statuses[status] = statuses.get(status, 0) + 1
+
+        batch = json.loads(meta)
+        batch['batch_id'] = batch_id
+        batch['statuses'] = statuses
+
+        return batch
+
+    @staticmethod
+    def batch_key(batch_id, name):
+
+        return f"leviathan:batch:{batch_id}:{name}"
 
-        return job
@@ -1,6 +1,6 @@
 from datetime import datetime
 import logging
-from models import ElasticIndex
+from models import ElasticIndex, EndpointCache
 from ctrl import Discover
 
 def run(record, appconfig):
@@ -23,7 +23,7 @@ def run(record, appconfig):
     ip = record['ip']
     record_id = record['_id']
 
-    #update the record via discovery
+    #update the record via discovery, which logs in under the device lease
     new_record = discover.device_info(ip)
     #add an update_time
     new_record['update_time'] = str(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
@@ -32,7 +32,10 @@ def run(record, appconfig):
     index = ElasticIndex(endpoint_index, elastic_host, elastic_port)
 
     #update document in elasticsearch based on fields and the _id value
-    index.update_document(record_id=record_id, updates=new_record)
+    index.update_document(record_id=record_id, updates=new_record, refresh="wait_for")
+
+    #drop the cached endpoint so the next page view reads the new information
+    EndpointCache.from_config(appconfig).invalidate(record['hostname'])
 
     #log the result
     if record['device_type'] == "unknown":
@@ -1,5 +1,7 @@
 import logging
 
+from models import EndpointCache
+
 def run(record, appconfig):
     """ record the device information after the ping check returns true
        ----------
@@ -19,5 +21,8 @@ def run(record, appconfig):
             logging.error(f"interface info is not supported ond devices type {record['device_type']}")
             return
 
-        # run rediscover_vlan_info
-        func((record, appconfig))
\ No newline at end of file
+        # run rediscover_interface_info
+        func(record, appconfig)
+
+        #drop the cached endpoint so the next page view reads the new information
+        EndpointCache.from_config(appconfig).invalidate(record['hostname'])
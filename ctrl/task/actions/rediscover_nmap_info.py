@@ -1,6 +1,6 @@
 import logging
 
-from models import ElasticIndex
+from models import ElasticIndex, EndpointCache
 from ctrl import Discover
 
 
@@ -27,7 +27,11 @@ def run(record, appconfig):
 
     #get the nmap scan info
     scan_info = discover.nmap_info(ip, hostname)
+    scan_info['endpoint_id'] = record['_id']
 
     #add the new scan information
-    index.add_document(scan_info)
+    index.add_document(scan_info, refresh="wait_for")
+
+    #drop the cached endpoint so the next page view reads the new information
+    EndpointCache.from_config(appconfig).invalidate(record['hostname'])
     logging.info(f"nmap scanned device {ip}")
\ No newline at end of file
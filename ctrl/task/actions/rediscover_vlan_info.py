@@ -1,5 +1,7 @@
 import logging
 
+from models import EndpointCache
+
 def run(record, appconfig):
     """ record the device information after the ping check returns true
    ----------
@@ -22,3 +24,6 @@ def run(record, appconfig):
 
         #run rediscover_vlan_info
         func(record, appconfig)
+
+        #drop the cached endpoint so the next page view reads the new information
+        EndpointCache.from_config(appconfig).invalidate(record['hostname'])
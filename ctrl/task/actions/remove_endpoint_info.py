@@ -1,6 +1,6 @@
 import logging
 
-from models import ElasticIndex
+from models import ElasticIndex, EndpointCache
 
 def run(record, appconfig):
     """ run task that removes all the information associated with an endpoint
@@ -20,6 +20,7 @@ def run(record, appconfig):
     interface_index = appconfig.INTERFACE_INDEX
     gateway_index = appconfig.GATEWAY_INDEX
     zone_index = appconfig.ZONE_INDEX
+    ep_details_index = appconfig.EP_DETAILS_INDEX
 
     #get local variables from the record dictionary
     hostname = record['hostname']
@@ -27,23 +28,21 @@ def run(record, appconfig):
 
     #remove the endpoint info from the endpoint index
     index = ElasticIndex(endpoint_index, host=elastic_host, port=elastic_port)
-    index.remove_document_by_id(doc_id=record_id)
+    index.remove_document_by_id(doc_id=record_id, refresh="wait_for")
     logging.info(f"deleted {hostname} endpoint information")
 
-    #create index list for enumaration
-    index_list = [nmap_index,vlan_index,interface_index,gateway_index, zone_index]
+    #create index list for enumaration, the endpoint index itself is never part of the cascade
+    index_list = [nmap_index, vlan_index, interface_index, gateway_index, zone_index, ep_details_index]
+    index_list = [i for i in dict.fromkeys(index_list) if i != endpoint_index]
 
-    total_removed = 0
+    #delete all records pertaining to the endpoint in one request that runs in the background on the server
+    #documents recorded by earlier sweeps belong to older endpoint ids, so the hostname is matched as well
+    response = index.delete_by_query({"hostname": hostname, "endpoint_id": record_id}, indices=index_list,
+                                     wait_for_completion=False)
+    logging.info(f"removing records for {hostname} with task {response['task']}")
 
-    #for each index name in the index_list, delete all records pertaining to hostname and increase total_removed by 1
-    for index_name in index_list:
-        index = ElasticIndex(index_name, host=elastic_host, port=elastic_port)
-        elastic_hits = index.query(hostname, field="hostname")
+    #the cached endpoint is only dropped once the delete is done, a page view before then would cache it again
+    result = index.wait_for_task(response['task'])
+    EndpointCache.from_config(appconfig).invalidate(hostname)
 
-        for eh in elastic_hits['hits']['hits']:
-
-            index.remove_document_by_id(eh['_id'])
-
-        total_removed = total_removed + len(elastic_hits['hits']['hits'])
-
-    logging.info(f"{total_removed} records for {hostname}")
\ No newline at end of file
+    logging.info(f"removed {(result or {}).get('deleted', 0)} records for {hostname}")
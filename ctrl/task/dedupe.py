@@ -0,0 +1,168 @@
+import uuid
+
+from redis.exceptions import WatchError
+from rq.job import Job, JobStatus
+
+
+class JobDedupe:
+    """ keeps one active job per action and ip address
+
+    A redis key per (action, ip) points at the id of the last job enqueued for it.  Enqueueing again while that job
+    is still queued, deferred, scheduled or running returns the existing job instead of adding another one.  The key
+    is carried in the job's meta as "dedupe_key".
+
+    Attributes
+    ----------
+    redis_connection: redis.Redis
+        connection used to store the keys
+    ttl: int
+        seconds a key is kept, after which the same action can be enqueued again whatever the job's state
+    """
+
+    key_prefix = "leviathan:dedupe"
+    active = {JobStatus.QUEUED, JobStatus.STARTED, JobStatus.DEFERRED, JobStatus.SCHEDULED}
+    # seconds a key may point at a job that does not exist yet because its caller is still enqueueing it
+    pending = 60
+
+    def __init__(self, redis_connection, ttl=3600):
+
+        self.redis_connection = redis_connection
+        self.ttl = ttl
+
+    def key(self, action, ip):
+
+        return f"{self.key_prefix}:{action}:{ip}"
+
+    def _existing(self, job_id, age):
+        """ returns the job the key points at when it is still active, None when the key can be taken over
+        Parameters
+        ----------
+            job_id:bytes
+                value of the key
+            age:int
+                seconds since the key was set
+        """
+
+        if job_id is None:
+            return None
+
+        job = Job.fetch_many([job_id.decode()], connection=self.redis_connection)[0]
+
+        if job is None:
+            # the caller that set the key is still enqueueing its job
+            if age < self.pending:
+                return Job(job_id.decode(), connection=self.redis_connection)
+            return None
+
+        if job.get_status(refresh=False) in self.active:
+            return job
+
+        return None
+
+    def _claim(self, key, job_id):
+        """ points the key at job_id unless it holds an active job, returns that job or None once the key is taken """
+
+        with self.redis_connection.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    previous = pipe.get(key)
+                    age = self.ttl - pipe.ttl(key)
+
+                    existing = self._existing(previous, age)
+                    if existing:
+                        pipe.unwatch()
+                        return existing
+
+                    # only taken over if nobody else set the key since it was read
+                    pipe.multi()
+                    pipe.set(key, job_id, ex=self.ttl)
+                    pipe.execute()
+                    return None
+
+                except WatchError:
+                    continue
+
+    def enqueue(self, queue, action, ip, func, **kwargs):
+        """ enqueues func on the queue unless a job for the action and ip is active, returns the job either way
+        Parameters
+        ----------
+            queue:rq.Queue
+                queue to enqueue on
+            action:str
+                name of the action
+            ip:str
+                ip address the action runs against
+            func:
+                function enqueued, kwargs are passed to queue.enqueue
+        """
+
+        key = self.key(action, ip)
+        job_id = uuid.uuid4().hex
+
+        # only the caller that sets the key enqueues, everyone else gets the job it points at
+        if not self.redis_connection.set(key, job_id, nx=True, ex=self.ttl):
+            existing = self._claim(key, job_id)
+            if existing:
+                return existing
+
+        meta = dict(kwargs.pop("meta", None) or {}, dedupe_key=key)
+
+        return queue.enqueue(func, job_id=job_id, meta=meta, **kwargs)
+
+    def enqueue_many(self, queue, job_datas, actions, pipeline=None):
+        """ enqueue_many that skips the job datas whose (action, ip) already has an active job
+
+        Every key is set with SET NX in one round trip and only the job datas whose key was set are enqueued, so two
+        overlapping callers never both enqueue the same action and ip.
+        Parameters
+        ----------
+            queue:rq.Queue
+                queue to enqueue on
+            job_datas:list
+                from Queue.prepare_data
+            actions:list
+                (action, ip) for each job data
+            pipeline:redis.client.Pipeline
+                pipeline the new jobs are added to, executed here when not given
+
+        Returns
+        -------
+            list of jobs lining up with job_datas, each one either the existing active job or the new one
+        """
+
+        keys = [self.key(action, ip) for action, ip in actions]
+        if not keys:
+            return []
+
+        ids = [uuid.uuid4().hex for _ in keys]
+
+        with self.redis_connection.pipeline(transaction=False) as pipe:
+            for key, job_id in zip(keys, ids):
+                pipe.set(key, job_id, nx=True, ex=self.ttl)
+            won = pipe.execute()
+
+        jobs = [None] * len(job_datas)
+        new = []
+
+        for i, (key, job_id, job_data, is_set) in enumerate(zip(keys, ids, job_datas, won)):
+            # a key held by another caller only comes back to us if its job is done
+            if not is_set:
+                jobs[i] = self._claim(key, job_id)
+                if jobs[i]:
+                    continue
+
+            meta = dict(job_data.meta or {}, dedupe_key=key)
+            new.append((i, job_data._replace(job_id=job_id, meta=meta)))
+
+        pipe = pipeline if pipeline is not None else self.redis_connection.pipeline()
+
+        enqueued = queue.enqueue_many([job_data for _, job_data in new], pipeline=pipe)
+
+        if pipeline is None:
+            pipe.execute()
+
+        for (i, _), job in zip(new, enqueued):
+            jobs[i] = job
+
+        return jobs
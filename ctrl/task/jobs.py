@@ -0,0 +1,90 @@
+import logging
+
+from rq import get_current_job
+
+from models import ElasticIndex, DeviceBusy
+from .actions import rediscover_device_info, rediscover_nmap_info, rediscover_vlan_info, remove_endpoint_info, \
+    rediscover_interface_info
+
+# action name to the task that runs it
+ACTIONS = {
+    "device_info": rediscover_device_info.run,
+    "nmap_info": rediscover_nmap_info.run,
+    "vlan_info": rediscover_vlan_info.run,
+    "interface_info": rediscover_interface_info.run,
+    "remove": remove_endpoint_info.run,
+}
+
+
+def context():
+    """ returns the configuration and endpoint index a job runs with, resolved inside the work horse instead of being
+    pickled into the job """
+
+    # imported here since config imports the plugins, which should not be loaded until a job runs
+    from config import Config
+
+    index = ElasticIndex(Config.ENDPOINT_INDEX, host=Config.ELASTIC_HOST, port=Config.ELASTIC_PORT)
+
+    return Config, index
+
+
+def run(action, endpoint_id, options=None):
+    """ runs the action for the endpoint, the job only carries the action name and endpoint id
+    Parameters
+    ----------
+        action:str
+            key of ACTIONS
+        endpoint_id:str
+            _id of the endpoint record
+        options:dict
+            keyword arguments passed on to the task
+    """
+
+    appconfig, index = context()
+
+    # a get by id is realtime so a record indexed moments ago is found
+    records = index.get_documents([endpoint_id])
+
+    if not records:
+        logging.warning(f"endpoint {endpoint_id} no longer exists, skipping {action}")
+        return
+
+    try:
+        ACTIONS[action](records[0], appconfig, **(options or {}))
+    except DeviceBusy as e:
+        if defer(appconfig):
+            logging.info(f"{e}, {action} for {endpoint_id} deferred")
+        raise
+
+
+def defer(appconfig):
+    """ has the running job retried under the same id DEVICE_LEASE_RETRY_DELAY seconds after it fails because its
+    device is busy
+
+    The caller raises the DeviceBusy again once this returns True, the worker then puts the job in the scheduled
+    registry instead of the failed one (rq's retry), so its id stays in its batch and dedupe key.  The worker has to
+    run with the scheduler for the job to be enqueued again.  Returns False when there is no running job or it has
+    already been retried DEVICE_LEASE_RETRIES times, the job then fails as normal.
+    Parameters
+    ----------
+        appconfig: config.Config
+            environmental variables
+    """
+
+    job = get_current_job()
+
+    if job is None:
+        return False
+
+    remaining = job.meta.get("lease_retries_left", appconfig.DEVICE_LEASE_RETRIES)
+
+    if remaining <= 0:
+        return False
+
+    # the worker handles the failure with this same job object, so a single retry only has to be set on it.  rq
+    # uses it up when rescheduling, so any later failure that is not DeviceBusy fails the job as normal
+    job.meta["lease_retries_left"] = remaining - 1
+    job.retries_left = 1
+    job.retry_intervals = [appconfig.DEVICE_LEASE_RETRY_DELAY]
+
+    return True
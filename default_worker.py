@@ -16,4 +16,5 @@ if __name__ == '__main__':
     with Connection(redis_connection):
         worker = Worker([Queue('default')])
 
-    worker.work()
+    # the scheduler enqueues jobs deferred while their device was busy
+    worker.work(with_scheduler=True)
@@ -1,2 +1,6 @@
-from .elasticindex import ElasticIndex, ElasticIndexError
+from .elasticindex import ElasticIndex, ElasticIndexError, ElasticClients, ElasticMetadata, log_bulk_errors
+from .mappings import index_bodies
+from .redisclients import RedisClients
+from .endpointcache import EndpointCache
+from .devicelease import DeviceLease, DeviceBusy, leased
 from .devices import SwitchCLI, SwitchCLIError, PanOSFirewall, PanOSFirewallError
\ No newline at end of file
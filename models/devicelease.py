@@ -0,0 +1,140 @@
+#
+# Joseph Berger <airmanberger@gmail.com>
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+from redis.exceptions import RedisError
+import functools
+import logging
+import uuid
+
+from .redisclients import RedisClients
+
+class DeviceBusy(Exception):
+    pass
+
+class DeviceLease():
+    """ redis semaphore that limits how many tasks talk to one device at a time
+
+    Each holder adds a random token per login it makes to a sorted set for the device, scored by when its lease
+    expires according to the redis server clock so workers with skewed clocks agree.  A holder that dies without
+    releasing is dropped once its lease expires, so a device can never be locked out for longer than the ttl.  Used as
+    a context manager it raises DeviceBusy when the device does not have count logins free, and the caller is expected
+    to try again later rather than fail.
+
+    Attributes
+    ----------
+    redis_connection: redis.Redis
+        connection used to store the lease
+    ip: str
+        ip address of the device
+    limit: int
+        number of logins allowed to the device at once
+    ttl: int
+        seconds before a lease that was never released expires
+    count: int
+        number of logins this holder makes at once, never more than the limit
+    """
+
+    key_prefix = "leviathan:lease"
+
+    def __init__(self, redis_connection, ip, limit=1, ttl=600, count=1):
+
+        self.redis_connection = redis_connection
+        self.ip = ip
+        self.limit = limit
+        self.ttl = ttl
+        self.count = max(min(count, limit), 1)
+        self.tokens = []
+
+    @classmethod
+    def from_config(cls, appconfig, ip, count=1):
+
+        return cls(RedisClients.get(appconfig.REDIS_HOST, appconfig.REDIS_PORT), ip,
+                   limit=appconfig.DEVICE_LEASE_LIMIT, ttl=appconfig.DEVICE_LEASE_TTL, count=count)
+
+    @property
+    def key(self):
+
+        return f"{self.key_prefix}:{self.ip}"
+
+    def acquire(self):
+        """ returns True if the lease was taken, False if the device does not have count logins free """
+
+        tokens = [uuid.uuid4().hex for _ in range(self.count)]
+        seconds, microseconds = self.redis_connection.time()
+        now = seconds + microseconds / 1000000
+
+        with self.redis_connection.pipeline() as pipe:
+            pipe.zremrangebyscore(self.key, 0, now)
+            pipe.zadd(self.key, {token: now + self.ttl for token in tokens})
+            pipe.expire(self.key, self.ttl)
+            pipe.zcard(self.key)
+            logins = pipe.execute()[-1]
+
+        # the pipeline runs as one transaction, so a holder that takes the device past its limit sees every login
+        # taken before it and backs out again
+        if logins > self.limit:
+            self.redis_connection.zrem(self.key, *tokens)
+            return False
+
+        self.tokens = tokens
+        return True
+
+    def handoff(self, count=1):
+        """ moves count of the held logins to a new lease that is returned, so they stay leased after this lease is
+        released (ex a session kept open for a later task) """
+
+        kept = DeviceLease(self.redis_connection, self.ip, limit=self.limit, ttl=self.ttl, count=count)
+        kept.tokens, self.tokens = self.tokens[:count], self.tokens[count:]
+
+        return kept
+
+    def release(self):
+
+        if not self.tokens:
+            return
+
+        try:
+            self.redis_connection.zrem(self.key, *self.tokens)
+        except RedisError as e:
+            logging.warning(f"failed to release the lease on {self.ip} due to {e}, it expires in {self.ttl}s")
+
+        self.tokens = []
+
+    def __enter__(self):
+
+        if not self.acquire():
+            raise DeviceBusy(f"{self.ip} does not have {self.count} of its {self.limit} login(s) free")
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        self.release()
+
+def leased(func):
+    """ decorator for plugin and task functions taking (record, appconfig, ...) that holds the device lease on
+    record['ip'] while the function runs, raises DeviceBusy if the device is in use.  A caller that already holds the
+    device passes its lease as lease= and the function runs under it instead """
+
+    @functools.wraps(func)
+    def wrapper(record, appconfig, *args, lease=None, **kwargs):
+
+        if lease is not None:
+            return func(record, appconfig, *args, **kwargs)
+
+        with DeviceLease.from_config(appconfig, record['ip']):
+            return func(record, appconfig, *args, **kwargs)
+
+    return wrapper
@@ -68,7 +68,8 @@ class SwitchCLI:
     retrieve_equipment()
         pulls the lld information information and populates the lld_neighbors variable
     """
-    def __init__(self, ip, username, password, secret, device_type,hostname=None,slow_connection=False):
+    def __init__(self, ip, username, password, secret, device_type,hostname=None,slow_connection=False,
+                 connection=None):
         """
         Parameters
         ----------
@@ -86,6 +87,8 @@ class SwitchCLI:
                 hostname of the device
             slow_connection: bool
                 flag it as a slow connection and use the delay factor for commands
+            connection: netmiko.BaseConnection, optional
+                already authenticated session for the device, used instead of logging in again
         """
 
         supported_dt = ['cisco_ios','cisco_nxos','arista_eos']
@@ -111,10 +114,20 @@ class SwitchCLI:
             'port': 22,
         }
 
-        try:
-            self.cli = netmiko.ConnectHandler(**net_device)
-        except Exception as e:
-            raise SwitchCLIError(f"{self.hostname}: could not connect over ssh (port 22)")
+        # a handed over session may have sat idle past the device's exec-timeout, log in fresh if it has
+        if connection and self._alive(connection):
+            self.cli = connection
+        else:
+            if connection:
+                try:
+                    connection.disconnect()
+                except Exception:
+                    pass
+
+            try:
+                self.cli = netmiko.ConnectHandler(**net_device)
+            except Exception as e:
+                raise SwitchCLIError(f"{self.hostname}: could not connect over ssh (port 22)")
 
         try:
             self.cli.enable()
@@ -147,6 +160,13 @@ class SwitchCLI:
 
         self.slow_connection = slow_connection
 
+    @staticmethod
+    def _alive(connection):
+
+        try:
+            return connection.is_alive()
+        except Exception:
+            return False
 
     def retrive_config(self):
         """ pulls the config from the device via netmiko and stores in self.config
@@ -13,86 +13,369 @@
 # OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 #
 
-from elasticsearch import Elasticsearch
-from elasticsearch.helpers import bulk, scan
+from elasticsearch import Elasticsearch, Urllib3HttpConnection
+from elasticsearch.helpers import bulk, scan, streaming_bulk
 import elasticsearch.exceptions
+from .mappings import SETTINGS
+from urllib3.connection import HTTPConnection
 import json
-import requests
+import logging
+import socket
+import threading
+import time
 
 class ElasticIndexError(Exception):
     pass
 
+def log_bulk_errors(errors, hostname):
+    """ logs the documents that failed in a bulk add
+    Parameters
+    ----------
+        errors:list
+            errors returned by ElasticIndex.add_documents
+        hostname:str
+            hostname of the device the documents belong to
+    """
+
+    for error in errors:
+        logging.error(f"failed to record document for {hostname} due to {error['error']}")
+
+class KeepAliveConnection(Urllib3HttpConnection):
+    """ urllib3 connection that turns on tcp keepalive for the pooled sockets so idle connections are not dropped """
+
+    def __init__(self, *args, tcp_keepalive=True, **kwargs):
+
+        super().__init__(*args, **kwargs)
+
+        if tcp_keepalive:
+            self.pool.conn_kw['socket_options'] = HTTPConnection.default_socket_options + [
+                (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+
+class ElasticClients():
+    """ process wide registry of Elasticsearch clients keyed by host and port
+
+    Clients are created lazily the first time a host and port is asked for and then shared by every ElasticIndex,
+    so each process keeps one connection pool per cluster instead of one per ElasticIndex object.  Pool size,
+    keepalive and timeouts come from the ELASTIC_* settings in config.Config.
+    """
+
+    _clients = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def options(cls):
+
+        # imported here since config imports the plugins, which import this module
+        from config import Config
+
+        return {
+            'connection_class': KeepAliveConnection,
+            'maxsize': Config.ELASTIC_POOL_MAXSIZE,
+            'timeout': Config.ELASTIC_TIMEOUT,
+            'max_retries': Config.ELASTIC_MAX_RETRIES,
+            'retry_on_timeout': True,
+            'tcp_keepalive': Config.ELASTIC_KEEPALIVE,
+        }
+
+    @classmethod
+    def get(cls, host, port):
+        """ returns the shared client for the host and port, creating it the first time """
+
+        key = (str(host), str(port))
+
+        client = cls._clients.get(key)
+        if client:
+            return client
+
+        with cls._lock:
+            if key not in cls._clients:
+                cls._clients[key] = Elasticsearch([{'host': key[0], 'port': key[1]}], **cls.options())
+
+            return cls._clients[key]
+
+    @classmethod
+    def clear(cls):
+        """ drops every client, used after forking so a child process does not share its parent's sockets """
+
+        with cls._lock:
+            cls._clients = {}
+
+class ElasticMetadata():
+    """ process wide cache of the index and alias names on each cluster
+
+    The names are read with one _alias request and kept for ELASTIC_METADATA_TTL seconds, so checking whether an
+    index exists does not cost a HEAD request every time.  ElasticIndex clears the cache when it creates or deletes an
+    index, an index created by the first write to it is picked up once the cached names expire.
+    """
+
+    _names = {}
+    _fields = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def ttl(cls):
+
+        # imported here since config imports the plugins, which import this module
+        from config import Config
+
+        return Config.ELASTIC_METADATA_TTL
+
+    @classmethod
+    def names(cls, host, port):
+        """ returns the set of index and alias names on the cluster """
+
+        key = (str(host), str(port))
+
+        cached = cls._names.get(key)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+
+        indices = ElasticClients.get(*key).indices.get_alias(index="*")
+
+        names = set(indices)
+        for info in indices.values():
+            names.update(info.get('aliases', {}))
+
+        with cls._lock:
+            cls._names[key] = (time.monotonic() + cls.ttl(), names)
+
+        return names
+
+    @classmethod
+    def exact_fields(cls, host, port, index, field):
+        """ returns a dictionary of concrete index name to the field holding the unanalyzed value of the field
+
+        That is the field itself when it is mapped as anything but text (keyword, ip, date...), and its .keyword
+        subfield when it was dynamically mapped as text, which is how indices created before the mapping template
+        hold hostname and endpoint_id.  Indices where the field is not mapped yet are left out, an empty result is cached
+        like any other so searches against missing indices do not ask for the mapping every time.
+        """
+
+        key = (str(host), str(port), index, field)
+
+        cached = cls._fields.get(key)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+
+        try:
+            response = ElasticClients.get(host, port).indices.get_field_mapping(
+                fields=f"{field},{field}.keyword", index=index, ignore_unavailable=True, allow_no_indices=True)
+        except elasticsearch.exceptions.NotFoundError:
+            response = {}
+
+        fields = {}
+        for name, info in response.items():
+            mappings = info.get('mappings', {})
+            mapping = next(iter(mappings.get(field, {}).get('mapping', {}).values()), {})
+
+            if mapping.get('type', 'text') != 'text':
+                fields[name] = field
+            elif f"{field}.keyword" in mappings:
+                fields[name] = f"{field}.keyword"
+
+        with cls._lock:
+            cls._fields[key] = (time.monotonic() + cls.ttl(), fields)
+
+        return fields
+
+    @classmethod
+    def clear(cls, host=None, port=None):
+
+        with cls._lock:
+            if host is None:
+                cls._names = {}
+                cls._fields = {}
+            else:
+                cls._names.pop((str(host), str(port)), None)
+                cls._fields = {k: v for k, v in cls._fields.items() if k[:2] != (str(host), str(port))}
+
 class ElasticIndex():
 
+    # hits fetched per request when paging, and by a lookup without a size before it has to page
+    page_size = 1000
+
     def __init__(self, index, host="localhost", port="9200", auth=None):
 
         self.es_server = host
         self.port = str(port)
         self.index = index
 
-        self.es = Elasticsearch([{'host': self.es_server, 'port': self.port}])
-
-    def build(self):
-
-        settings = """{
-        "index": {
-           "analysis": {
-               "filter" : {
-                 "my_word_delimiter" : {
-                     "type" : "word_delimiter",
-                     "preserve_original": "true"
-                 }   
-             },
-              "analyzer": {
-                 "my_analyzer": {
-                    "type": "custom",
-                    "tokenizer": "whitespace",
-                    "filter": [
-                       "lowercase",
-                       "stop",
-                       "my_word_delimiter"
-                    ]
-                         }
-                     }
-                 }
-             }
-         }"""
-
-        status = requests.put(url=f"http://{self.es_server}:{self.port}/{self.index}")
-        if status.status_code == 200:
-
-            #print(f"Successfully created index {self.index}")
-            status = requests.post(url=f"http://{self.es_server}:{self.port}/{self.index}/_close")
-            status = requests.put(url=f"http://{self.es_server}:{self.port}/{self.index}/_settings", data=settings,
-                              headers={"Content-Type": "application/json"})
-
-            status = requests.post(url=f"http://{self.es_server}:{self.port}/{self.index}/_open")
-
-            return True
-
-        return False
+        self.es = ElasticClients.get(self.es_server, self.port)
+
+    def build(self, body=None):
+        """ creates the index with its settings and mappings in a single request
+
+        When a body is given it is also stored as an index template, so the index is created with the same mappings
+        if it is deleted and then written to before build is called again.
+
+        Parameters
+        ----------
+            body:dict
+                {"settings": ..., "mappings": ...} from models.mappings.index_bodies, only the analyzer settings
+                when not given
+
+        Returns
+        -------
+            False if the index already exists
+        """
+
+        if body:
+            self.put_template(body)
+        else:
+            body = {"settings": SETTINGS}
+
+        try:
+            self.es.indices.create(index=self.index, body=body)
+        except elasticsearch.exceptions.RequestError:
+            return False
+        finally:
+            ElasticMetadata.clear(self.es_server, self.port)
+
+        return True
+
+    def put_template(self, body):
+        """ creates or replaces the index template matching only this index """
+
+        template = {
+            "index_patterns": [self.index],
+            "priority": 100,
+            "template": body,
+        }
+
+        self.es.indices.put_index_template(name=f"{self.index}-template", body=template)
 
     def delete(self):
 
-        status = requests.delete(url=f"http://{self.es_server}:{self.port}/{self.index}")
+        try:
+            self.es.indices.delete(index=self.index)
+        except elasticsearch.exceptions.NotFoundError:
+            return False
+        finally:
+            ElasticMetadata.clear(self.es_server, self.port)
 
-        if status.status_code == 200:
+        return True
 
-            return True
+    def exists(self):
+        """ checks the index (or alias) exists against the cached cluster metadata """
 
-        return False
+        return self.index in ElasticMetadata.names(self.es_server, self.port)
 
-    def rebuild(self):
+    def rebuild(self, body=None):
 
         if self.delete():
-            self.build()
+            self.build(body)
 
-    def add_document(self, data):
+    def add_document(self, data, refresh=False):
 
-        doc = self.es.index(index=self.index, ignore=400, doc_type='_doc', body=json.loads(json.dumps(data)))
+        doc = self.es.index(index=self.index, ignore=400, doc_type='_doc', body=json.loads(json.dumps(data)),
+                            refresh=refresh)
         data['_id'] = doc['_id']
         return data
 
+    def add_documents(self, docs, chunk_size=500, refresh=False):
+        """ indexes many documents with the bulk api, sets '_id' on each document that was indexed
+
+        Parameters
+        ----------
+            docs:list
+                documents to index
+            chunk_size:int
+                number of documents sent per bulk request
+            refresh:bool|str
+                "wait_for" returns once the documents are visible to searches
+
+        Returns
+        -------
+            (ids, errors) where ids lines up with docs (None for a failed document) and errors is a list of
+            {"doc": doc, "error": error} for every document that failed
+        """
+
+        docs = list(docs)
+
+        actions = ({"_op_type": "index", "_index": self.index, "_source": self._body(doc)} for doc in docs)
+
+        return self._bulk(docs, actions, chunk_size, refresh)
+
+    def upsert_documents(self, docs, id_key="_id", chunk_size=500):
+        """ updates many documents by id with the bulk api, creating any document that does not exist
+
+        Parameters
+        ----------
+            docs:list
+                documents to upsert, each one holds its id under id_key
+            id_key:str
+                key of the document id in each document
+            chunk_size:int
+                number of documents sent per bulk request
+
+        Returns
+        -------
+            (ids, errors) the same as add_documents
+        """
+
+        docs = list(docs)
+
+        actions = ({"_op_type": "update", "_index": self.index, "_id": doc[id_key],
+                    "doc": self._body(doc, id_key), "doc_as_upsert": True} for doc in docs)
+
+        return self._bulk(docs, actions, chunk_size)
+
+    @staticmethod
+    def _body(doc, id_key="_id"):
+
+        body = json.loads(json.dumps(doc))
+        body.pop(id_key, None)
+        body.pop("_id", None)
+
+        return body
+
+    def _bulk(self, docs, actions, chunk_size, refresh=False):
+
+        ids = []
+        errors = []
+
+        # streaming_bulk yields one result per action in order, so results line up with docs
+        results = streaming_bulk(self.es, actions, chunk_size=chunk_size, raise_on_error=False,
+                                 raise_on_exception=False, yield_ok=True, refresh=refresh)
+
+        for doc, (ok, item) in zip(docs, results):
+            result = next(iter(item.values()))
+
+            if ok:
+                doc['_id'] = result['_id']
+                ids.append(result['_id'])
+            else:
+                ids.append(None)
+                errors.append({"doc": doc, "error": result.get('error', result)})
+
+        return ids, errors
+
+    def get_documents(self, doc_ids):
+        """ fetches many documents by id with a single _mget request
+
+        Returns
+        -------
+            list of the _source of each document found with its _id added, ids that do not exist are skipped
+        """
+
+        doc_ids = list(doc_ids)
+        if not doc_ids:
+            return []
+
+        try:
+            response = self.es.mget(index=self.index, body={"ids": doc_ids})
+        except elasticsearch.exceptions.NotFoundError:
+            return []
+
+        docs = []
+        for doc in response['docs']:
+            if doc.get('found'):
+                source = doc['_source']
+                source['_id'] = doc['_id']
+                docs.append(source)
+
+        return docs
+
     def remove_document(self, doc):
 
         try:
@@ -100,52 +383,231 @@ class ElasticIndex():
         except Exception:
             pass
 
-    def remove_document_by_id(self, doc_id):
+    def remove_document_by_id(self, doc_id, refresh=False):
 
         try:
-            self.es.delete(index=self.index, doc_type="_doc", id=doc_id)
+            self.es.delete(index=self.index, doc_type="_doc", id=doc_id, refresh=refresh)
         except Exception:
             pass
 
-    def update_document(self,record_id,updates):
+    def delete_by_query(self, matches, indices=None, wait_for_completion=True):
+        """ deletes every document matching any of the field values on the server with _delete_by_query
 
-        body={"doc": updates}
+        Parameters
+        ----------
+            matches:dict
+                field to exact value, a document is deleted if any one of them matches (ex {"endpoint_id": "..."})
+            indices:list
+                index names to delete from, defaults to this index.  missing indices are ignored
+            wait_for_completion:bool
+                wait for the delete to finish, when false the delete runs as a background task on the server (see
+                wait_for_task).  the indices are refreshed once the delete is done either way
 
-        self.es.update(index=self.index, id=record_id, body=body)
+        Returns
+        -------
+            the response, holding "deleted" when waiting or the server "task" id when not
+        """
 
-    def lquery(self, search, field='*', exact_match=True, size=10000):
+        if not indices:
+            indices = [self.index]
 
-        if exact_match:
-            search = '"'+str(search)+'"'
+        should = [self._exact(field, value, indices) for field, value in matches.items()]
+        body = {"query": {"bool": {"should": should, "minimum_should_match": 1}}}
+
+        try:
+            return self.es.delete_by_query(index=",".join(indices), body=body, conflicts="proceed",
+                                           ignore_unavailable=True, refresh=True,
+                                           wait_for_completion=wait_for_completion)
+        except elasticsearch.exceptions.RequestError as e:
+            raise ElasticIndexError(e)
+
+    def wait_for_task(self, task_id, timeout=300):
+        """ waits up to timeout seconds for a background task (ex a delete_by_query that did not wait for completion)
+        and returns its response, None if it has not finished by then """
+
+        try:
+            # the request itself has to outlive the server side wait, the client timeout is much shorter
+            task = self.es.tasks.get(task_id=task_id, wait_for_completion=True, timeout=f"{timeout}s",
+                                     request_timeout=timeout + 30)
+        except elasticsearch.exceptions.ElasticsearchException as e:
+            logging.warning(f"stopped waiting for task {task_id} due to {e}")
+            return None
+
+        return task.get('response')
+
+    def lookup(self, matches, size=None, sort_field=False, sort_order="asc"):
+        """ returns the documents whose fields exactly equal the given values
+
+        The terms run in filter context, so nothing is scored and the node query cache can reuse the result for
+        repeated lookups of the same hostname or endpoint id.
+
+        Parameters
+        ----------
+            matches:dict
+                field to exact value, every one of them has to match (ex {"hostname": "sw1"})
+            size:int
+                maximum number of documents returned, every matching document when not given
+            sort_field:str
+                field the documents are sorted on
+            sort_order:str
+                asc or desc
+
+        Returns
+        -------
+            list of the _source of each hit with its _id added, empty if the index does not exist
+        """
+
+        if size is None:
+            search_param = self._lookup_body(matches, sort_field=sort_field, sort_order=sort_order)
+            return list(self.iter_documents(search_param['query'], sort=search_param.get('sort')))
+
+        search_param = self._lookup_body(matches, size, sort_field, sort_order)
+
+        try:
+            response = self.es.search(index=self.index, body=search_param)
+        except elasticsearch.exceptions.NotFoundError:
+            return []
+        except elasticsearch.exceptions.RequestError as e:
+            raise ElasticIndexError(e)
+
+        return self._sources(response)
+
+    def lookup_many(self, lookups):
+        """ runs many exact lookups, against any index, in a single _msearch request
+
+        Parameters
+        ----------
+            lookups:list
+                dictionaries with "matches" and optionally "index" (defaults to this index), "size", "sort_field"
+                and "sort_order", the same as the arguments of lookup.  a lookup without a size returns every
+                matching document, the ones with more than one page of matches are paged through afterwards
+
+        Returns
+        -------
+            list lining up with lookups, each one a list of the _source of each hit with its _id added.  a lookup
+            against an index that does not exist gives an empty list, any other failed lookup raises
+            ElasticIndexError
+        """
+
+        body = []
+        for lu in lookups:
+            body.append({"index": lu.get("index", self.index), "ignore_unavailable": True})
+            body.append(self._lookup_body(lu["matches"], lu.get("size", self.page_size), lu.get("sort_field", False),
+                                          lu.get("sort_order", "asc"), lu.get("index", self.index)))
+
+        try:
+            responses = self.es.msearch(body=body)['responses']
+        except elasticsearch.exceptions.RequestError as e:
+            raise ElasticIndexError(e)
+
+        results = []
+        for lu, response in zip(lookups, responses):
+            if "error" in response:
+                raise ElasticIndexError(f"lookup of {lu['matches']} in {lu.get('index', self.index)} failed due to "
+                                        f"{response['error']}")
+
+            hits = self._sources(response)
+
+            if "size" not in lu and len(hits) < response['hits']['total']['value']:
+                index = ElasticIndex(lu.get("index", self.index), host=self.es_server, port=self.port)
+                hits = index.lookup(lu["matches"], sort_field=lu.get("sort_field", False),
+                                    sort_order=lu.get("sort_order", "asc"))
+
+            results.append(hits)
+
+        return results
+
+    def _lookup_body(self, matches, size=None, sort_field=False, sort_order="asc", index=None):
+
+        indices = [index or self.index]
+        search_param = {"query": {"bool": {"filter": [self._exact(field, value, indices)
+                                                      for field, value in matches.items()]}}}
+
+        if size is not None:
+            search_param['size'] = size
+
+        if sort_field:
+            # indices without the field yet (ex created before it was added) sort it as missing instead of failing
+            search_param['sort'] = [{sort_field: {"order": sort_order, "unmapped_type": "keyword"}}]
+
+        return search_param
+
+    @staticmethod
+    def _sources(response):
+
+        hits = []
+        for hit in response['hits']['hits']:
+            doc = hit['_source']
+            doc['_id'] = hit['_id']
+            hits.append(doc)
+
+        return hits
+
+    def _exact(self, field, value, indices=None):
+        """ exact match on a field, only ever against its unanalyzed keyword (or other non text) field
+
+        A term on a dynamically mapped text field matches any document with the same token, "sw1" would match
+        "sw1-core", so the field to use is read from the mapping of each index (see ElasticMetadata.exact_fields).
+        """
+
+        fields = {}
+        for index in indices or [self.index]:
+            fields.update(ElasticMetadata.exact_fields(self.es_server, self.port, index, field))
+
+        names = set(fields.values())
+
+        # not mapped anywhere yet, the keyword subfield is never analyzed so nothing else can match
+        if not names:
+            return {"term": {f"{field}.keyword": value}}
+
+        if len(names) == 1:
+            return {"term": {names.pop(): value}}
+
+        # indices created before and after the mapping template keep the exact value in different fields
+        return {"bool": {"should": [{"bool": {"filter": [{"term": {"_index": name}}, {"term": {exact: value}}]}}
+                                    for name, exact in fields.items()],
+                         "minimum_should_match": 1}}
+
+    def update_document(self,record_id,updates, refresh=False):
+
+        body={"doc": updates}
+
+        self.es.update(index=self.index, id=record_id, body=body, refresh=refresh)
+
+    def lquery(self, search, field='*', exact_match=True, size=10000, track_total_hits=None):
 
         search_param = {
             "size": size,
-            "query": {
-                "query_string": {
-                    "query": search,
-                    "default_field": field
-                }
-            }
+            "query": self._lquery_body(search, field, exact_match)
         }
 
+        # hits.total stops counting at 10000 unless asked to count every hit
+        if track_total_hits is not None:
+            search_param['track_total_hits'] = track_total_hits
+
         try:
             response = self.es.search(index=self.index, body=search_param)
             return response
         except elasticsearch.exceptions.RequestError:
             raise ElasticIndexError(f"Query '{search}' contains invalid syntax.")
 
+    def search_sources(self, search, field='*', size=1000):
+        """ returns (hits, total), the _source of the first size hits of an lquery with its _id added and the number
+        of documents matching the query.  ([], 0) if the index does not exist """
+
+        try:
+            response = self.lquery(search, field, exact_match=False, size=size, track_total_hits=True)
+        except elasticsearch.exceptions.NotFoundError:
+            return [], 0
+
+        return self._sources(response), response['hits']['total']['value']
+
     def query(self, search, field=None, exact_match=True, size=10000, sort_field=False, sort_order="asc"):
 
         search_param = {
             "_source": True,
             "size": size,
-            "query": {
-                "simple_query_string": {
-                    "query": search,
-                    "analyze_wildcard": True,
-                    "default_operator": "AND"
-                }
-            }
+            "query": self._query_body(search, field)
         }
 
         if sort_field:
@@ -153,9 +615,6 @@ class ElasticIndex():
                     { sort_field: {"order" : sort_order}}
                   ]
 
-        if field:
-            search_param['query']['simple_query_string']['fields'] = [field]
-
         try:
 
             response = self.es.search(index=self.index, body=search_param)
@@ -163,3 +622,132 @@ class ElasticIndex():
 
         except elasticsearch.exceptions.RequestError as e:
             raise ElasticIndexError(e)
+
+    def iter_lquery(self, search, field='*', exact_match=True, page_size=1000):
+        """ generator version of lquery that pages through every hit instead of stopping at size
+
+        Parameters
+        ----------
+            search:str
+                lucene query string
+            field:str
+                default field of the query
+            exact_match:bool
+                quote the search so it is matched as a phrase
+            page_size:int
+                number of hits fetched per request
+
+        Returns
+        -------
+            generator of the _source of each hit with its _id added
+        """
+
+        try:
+            yield from self.iter_documents(self._lquery_body(search, field, exact_match), page_size=page_size)
+        except ElasticIndexError:
+            raise ElasticIndexError(f"Query '{search}' contains invalid syntax.")
+
+    def iter_query(self, search, field=None, page_size=1000, sort_field=False, sort_order="asc"):
+        """ generator version of query that pages through every hit instead of stopping at size
+
+        Returns
+        -------
+            generator of the _source of each hit with its _id added
+        """
+
+        sort = [{sort_field: {"order": sort_order}}] if sort_field else None
+
+        yield from self.iter_documents(self._query_body(search, field), page_size=page_size, sort=sort)
+
+    def iter_documents(self, query=None, page_size=1000, sort=None, keep_alive="1m"):
+        """ pages through every document matching the query with a point in time and search_after
+
+        Only one page of hits is held at a time, so the memory used does not grow with the number of documents.  The
+        point in time keeps the pages consistent while documents are indexed or deleted, and is closed once the
+        generator finishes or is closed early.
+
+        Parameters
+        ----------
+            query:dict
+                query dsl, every document when not given
+            page_size:int
+                number of hits fetched per request
+            sort:list
+                sort clauses applied before the tiebreaker
+            keep_alive:str
+                how long the point in time is kept between pages
+
+        Returns
+        -------
+            generator of the _source of each hit with its _id added
+        """
+
+        try:
+            pit_id = self.es.open_point_in_time(index=self.index, keep_alive=keep_alive)['id']
+        except elasticsearch.exceptions.NotFoundError:
+            return
+
+        search_param = {
+            "size": page_size,
+            "query": query or {"match_all": {}},
+            "sort": (sort or []) + [{"_shard_doc": "asc"}],
+            "track_total_hits": False,
+        }
+
+        try:
+            while True:
+                search_param['pit'] = {"id": pit_id, "keep_alive": keep_alive}
+
+                try:
+                    response = self.es.search(body=search_param)
+                except elasticsearch.exceptions.RequestError as e:
+                    raise ElasticIndexError(e)
+
+                # the point in time id can change between pages
+                pit_id = response.get('pit_id', pit_id)
+                hits = response['hits']['hits']
+
+                for hit in hits:
+                    doc = hit['_source']
+                    doc['_id'] = hit['_id']
+                    yield doc
+
+                if len(hits) < page_size:
+                    break
+
+                search_param['search_after'] = hits[-1]['sort']
+
+        finally:
+            try:
+                self.es.close_point_in_time(body={"id": pit_id})
+            except elasticsearch.exceptions.ElasticsearchException:
+                pass
+
+    @staticmethod
+    def _lquery_body(search, field, exact_match):
+
+        if exact_match:
+            search = '"'+str(search)+'"'
+
+        return {
+            "query_string": {
+                "query": search,
+                "default_field": field
+            }
+        }
+
+    @staticmethod
+    def _query_body(search, field):
+
+        body = {
+            "simple_query_string": {
+                "query": search,
+                "analyze_wildcard": True,
+                "default_operator": "AND"
+            }
+        }
+
+        if field:
+            body['simple_query_string']['fields'] = [field]
+
+        return body
@@ -0,0 +1,112 @@
+#
+# Joseph Berger <airmanberger@gmail.com>
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+from redis.exceptions import RedisError
+import json
+import logging
+import time
+
+from .redisclients import RedisClients
+
+class EndpointCache():
+    """ redis cache of everything recorded for an endpoint (Retrieve.endpoint_all) keyed by hostname
+
+    Entries expire after the ttl and the oldest entries are evicted once there are more than max_entries.  Anything
+    that writes data for an endpoint calls invalidate with its hostname so the next read goes back to elasticsearch,
+    after the write is visible to searches (refresh="wait_for") so that read cannot cache the old documents again.
+    A redis failure is logged and treated as a miss.
+
+    Attributes
+    ----------
+    redis_connection: redis.Redis
+        connection used to store the cache keys
+    ttl: int
+        seconds an entry is cached
+    max_entries: int
+        maximum number of endpoints cached
+    """
+
+    key_prefix = "leviathan:endpoint"
+
+    def __init__(self, redis_connection, ttl=300, max_entries=10000):
+
+        self.redis_connection = redis_connection
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    @classmethod
+    def from_config(cls, appconfig):
+        """ returns a cache using the redis and ENDPOINT_CACHE_* settings, the connection is shared per process """
+
+        return cls(RedisClients.get(appconfig.REDIS_HOST, appconfig.REDIS_PORT), ttl=appconfig.ENDPOINT_CACHE_TTL,
+                   max_entries=appconfig.ENDPOINT_CACHE_SIZE)
+
+    def key(self, hostname):
+
+        return f"{self.key_prefix}:{hostname}"
+
+    @property
+    def index_key(self):
+
+        # sorted set of cached hostnames scored by the time they were cached, used for eviction
+        return f"{self.key_prefix}s"
+
+    def get(self, hostname):
+        """ returns the cached endpoint, None on a miss """
+
+        try:
+            value = self.redis_connection.get(self.key(hostname))
+        except RedisError as e:
+            logging.warning(f"endpoint cache unavailable due to {e}")
+            return None
+
+        if value is None:
+            return None
+
+        return json.loads(value)
+
+    def set(self, hostname, endpoint):
+        """ caches the endpoint and evicts the oldest entries beyond max_entries """
+
+        try:
+            with self.redis_connection.pipeline() as pipe:
+                pipe.set(self.key(hostname), json.dumps(endpoint), ex=self.ttl)
+                pipe.zadd(self.index_key, {hostname: time.time()})
+                # entries whose keys have already expired
+                pipe.zremrangebyscore(self.index_key, 0, time.time() - self.ttl)
+                pipe.zcard(self.index_key)
+                count = pipe.execute()[-1]
+
+            if count > self.max_entries:
+                evicted = self.redis_connection.zpopmin(self.index_key, count - self.max_entries)
+                if evicted:
+                    self.redis_connection.delete(*[self.key(h.decode()) for h, _ in evicted])
+
+        except RedisError as e:
+            logging.warning(f"failed to cache endpoint {hostname} due to {e}")
+
+    def invalidate(self, *hostnames):
+        """ drops the cached entries so the next read goes to elasticsearch """
+
+        if not hostnames:
+            return
+
+        try:
+            with self.redis_connection.pipeline() as pipe:
+                pipe.delete(*[self.key(h) for h in hostnames])
+                pipe.zrem(self.index_key, *hostnames)
+                pipe.execute()
+        except RedisError as e:
+            logging.warning(f"failed to invalidate cached endpoints {', '.join(hostnames)} due to {e}")
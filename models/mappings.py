@@ -0,0 +1,99 @@
+#
+# Joseph Berger <airmanberger@gmail.com>
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+import copy
+
+# analyzer used by the hostname.text subfield and any dynamically mapped text
+SETTINGS = {
+    "index": {
+        "analysis": {
+            "filter": {
+                "my_word_delimiter": {
+                    "type": "word_delimiter",
+                    "preserve_original": "true"
+                }
+            },
+            "analyzer": {
+                "my_analyzer": {
+                    "type": "custom",
+                    "tokenizer": "whitespace",
+                    "filter": [
+                        "lowercase",
+                        "stop",
+                        "my_word_delimiter"
+                    ]
+                }
+            }
+        }
+    }
+}
+
+# exact lookups go against the keyword field, free text searches still match words through the text subfield
+HOSTNAME = {"type": "keyword", "fields": {"text": {"type": "text", "analyzer": "my_analyzer"}}}
+KEYWORD = {"type": "keyword"}
+TIMESTAMP = {"type": "date"}
+UPDATE_TIME = {"type": "date", "format": "yyyy-MM-dd HH:mm:ss||strict_date_optional_time"}
+
+# fields shared by every document written for an endpoint
+ENDPOINT_FIELDS = {
+    "hostname": HOSTNAME,
+    "endpoint_id": KEYWORD,
+}
+
+PROPERTIES = {
+    "endpoints": {
+        "hostname": HOSTNAME,
+        "ip": {"type": "ip"},
+        "credential": KEYWORD,
+        "device_type": KEYWORD,
+        "update_time": UPDATE_TIME,
+    },
+    "nmap": dict(ENDPOINT_FIELDS, **{"@timestamp": TIMESTAMP}),
+    "vlans": dict(ENDPOINT_FIELDS, number=KEYWORD, name=KEYWORD),
+    "interfaces": dict(ENDPOINT_FIELDS, name=KEYWORD, mode=KEYWORD),
+    "gateways": dict(ENDPOINT_FIELDS, **{"gateway-name": KEYWORD}),
+    "zones": dict(ENDPOINT_FIELDS, name=KEYWORD),
+    "ep_details": dict(ENDPOINT_FIELDS, **{"@timestamp": TIMESTAMP}),
+}
+
+def index_bodies(appconfig):
+    """ returns a dictionary of index name to the settings and mappings used to create it
+
+    Indices are named by the *_INDEX settings, so when two kinds of document share an index (the gateway index
+    defaults to the interface index) the index gets the properties of both.
+
+    Parameters
+    ----------
+        appconfig: config.Config
+            environmental variables
+    """
+
+    kinds = {
+        "endpoints": appconfig.ENDPOINT_INDEX,
+        "nmap": appconfig.NMAP_INDEX,
+        "vlans": appconfig.VLAN_INDEX,
+        "interfaces": appconfig.INTERFACE_INDEX,
+        "gateways": appconfig.GATEWAY_INDEX,
+        "zones": appconfig.ZONE_INDEX,
+        "ep_details": appconfig.EP_DETAILS_INDEX,
+    }
+
+    bodies = {}
+
+    for kind, index_name in kinds.items():
+        body = bodies.setdefault(index_name, {"settings": copy.deepcopy(SETTINGS), "mappings": {"properties": {}}})
+        body['mappings']['properties'].update(copy.deepcopy(PROPERTIES[kind]))
+
+    return bodies
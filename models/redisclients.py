@@ -0,0 +1,35 @@
+#
+# Joseph Berger <airmanberger@gmail.com>
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+from redis import Redis
+import threading
+
+class RedisClients():
+    """ process wide registry of Redis connections keyed by host and port, shared by the caches and leases that
+    plugins build from config.Config """
+
+    _clients = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, host, port):
+
+        key = (str(host), int(port))
+
+        with cls._lock:
+            if key not in cls._clients:
+                cls._clients[key] = Redis(host=key[0], port=key[1], db=0)
+
+            return cls._clients[key]
@@ -13,26 +13,32 @@
 # OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 #
 
+from datetime import datetime
 import logging
-from models import ElasticIndex
+from models import ElasticIndex, EndpointCache, log_bulk_errors, leased
 from models import SwitchCLI
 import yaml
 import re
 
-def record_details(record, appconfig):
+@leased
+def record_details(record, appconfig, connection=None):
     """ record the device information after the ping check returns true
        ----------
         device:dict
 
         appconfig:config.Config
+
+        connection:netmiko.BaseConnection
+            authenticated session from discovery to reuse instead of logging in again
        """
-    device = load(record, appconfig)
+    device = load(record, appconfig, connection)
 
     # elastic configs
     elastic_host = appconfig.ELASTIC_HOST
     elastic_port = appconfig.ELASTIC_PORT
     vlan_index = appconfig.VLAN_INDEX
     interface_index = appconfig.INTERFACE_INDEX
+    ep_details_index = appconfig.EP_DETAILS_INDEX
 
     # try to pull configuration
     try:
@@ -48,14 +54,16 @@ def record_details(record, appconfig):
     for vlan in device.vlans:
         vlan['hostname'] = device.hostname
         vlan['endpoint_id'] = record['_id']
-        index.add_document(vlan)
+    _, errors = index.add_documents(device.vlans, refresh="wait_for")
+    log_bulk_errors(errors, device.hostname)
 
     # set interface index and record
     index = ElasticIndex(interface_index, host=elastic_host, port=elastic_port)
     for interface in device.interfaces:
         interface['hostname'] = device.hostname
         interface['endpoint_id'] = record['_id']
-        index.add_document(interface)
+    _, errors = index.add_documents(device.interfaces, refresh="wait_for")
+    log_bulk_errors(errors, device.hostname)
 
     # get the endpoint system details
     version = device.cli.send_command("show version")
@@ -68,12 +76,17 @@ def record_details(record, appconfig):
             endpoint_details[key] = value
     endpoint_details['hostname'] = device.hostname
     endpoint_details['endpoint_id'] = record['_id']
-    index = ElasticIndex('ep_details', elastic_host, elastic_port)
-    index.add_document(endpoint_details)
+    endpoint_details['@timestamp'] = datetime.now().astimezone().isoformat()
+    index = ElasticIndex(ep_details_index, elastic_host, elastic_port)
+    index.add_document(endpoint_details, refresh="wait_for")
+
+    # the cached endpoint page no longer matches what was just recorded
+    EndpointCache.from_config(appconfig).invalidate(record['hostname'])
 
     logging.info(f"details for {device.hostname} pulled")
 
 
+@leased
 def rediscover_interface_info(record, appconfig):
     """ record the device information after the ping check returns true
        ----------
@@ -106,21 +119,20 @@ def rediscover_interface_info(record, appconfig):
     #set the index
     index = ElasticIndex(interface_index, elastic_host, elastic_port)
 
-    # remove the existing records from vlan index
-    elastic_hits = index.query(hostname, field="hostname")
-
-    for eh in elastic_hits['hits']['hits']:
-        index.remove_document_by_id(eh['_id'])
+    # remove the existing records from interface index
+    index.delete_by_query({"hostname": hostname, "endpoint_id": endpoint_id})
 
     # set interface index and record
     for interface in device.interfaces:
         interface['hostname'] = hostname
         interface['endpoint_id'] = endpoint_id
-        index.add_document(interface)
+    _, errors = index.add_documents(device.interfaces, refresh="wait_for")
+    log_bulk_errors(errors, hostname)
 
     logging.info(f"updated interfaces for endpoint {hostname}")
 
 
+@leased
 def rediscover_vlan_info(record, appconfig):
     """ record the device information after the ping check returns true
        ----------
@@ -137,7 +149,7 @@ def rediscover_vlan_info(record, appconfig):
     # elastic configs
     elastic_host = appconfig.ELASTIC_HOST
     elastic_port = appconfig.ELASTIC_PORT
-    vlan_index = appconfig.INTERFACE_INDEX
+    vlan_index = appconfig.VLAN_INDEX
 
     #variables extracted from record]
     hostname = record['hostname']
@@ -154,27 +166,27 @@ def rediscover_vlan_info(record, appconfig):
     index = ElasticIndex(vlan_index, elastic_host, elastic_port)
 
     #remove the existing records from vlan index
-    elastic_hits = index.query(hostname, field="hostname")
-
-    for eh in elastic_hits['hits']['hits']:
-        index.remove_document_by_id(eh['_id'])
+    index.delete_by_query({"hostname": hostname, "endpoint_id": endpoint_id})
 
     # set vlan index and record
     for vlan in device.vlans:
         vlan['endpoint_id'] = endpoint_id
         vlan['hostname'] = hostname
-        index.add_document(vlan)
+    _, errors = index.add_documents(device.vlans, refresh="wait_for")
+    log_bulk_errors(errors, hostname)
 
     logging.info(f"updated vlans for endpoint {hostname}")
 
 
-def load(record, appconfig):
+def load(record, appconfig, connection=None):
     """  load the device and return appopriate object
        ----------
             record:dict
                record from discover_device_info
             appconfig: config.Config
                 environmental variables
+            connection:netmiko.BaseConnection
+                authenticated session to reuse, a new session is opened if not given
 
         """
     credentials = appconfig.CREDENTIALS
@@ -194,6 +206,7 @@ def load(record, appconfig):
         'password': cred['password'],
         'secret': cred['secret'],
         'hostname': record['hostname'],
+        'connection': connection,
     }
 
     device = SwitchCLI(**device_info)
@@ -14,17 +14,27 @@
 #
 
 import logging
-from models import ElasticIndex, PanOSFirewall
+from models import ElasticIndex, EndpointCache, log_bulk_errors, PanOSFirewall, leased
 import yaml
 
-def record_details(record, appconfig):
+@leased
+def record_details(record, appconfig, connection=None):
     """ record the device information after the ping check returns true
        ----------
         record:dict
 
         appconfig:config.Config
+
+        connection:netmiko.BaseConnection
+            ssh session from discovery, details come from the xml api so it is closed
        """
 
+    if connection:
+        try:
+            connection.disconnect()
+        except Exception:
+            pass
+
     device = load(record, appconfig)
 
     # elastic configs
@@ -49,19 +59,25 @@ def record_details(record, appconfig):
     for interface in device.interfaces:
         interface['hostname'] = hostname
         interface['endpoint_id'] = endpoint_id
-        index.add_document(interface)
+    _, errors = index.add_documents(device.interfaces, refresh="wait_for")
+    log_bulk_errors(errors, hostname)
 
     index = ElasticIndex(gateway_index, host=elastic_host, port=elastic_port)
     for gateway in device.gateways:
         gateway['hostname'] = hostname
         gateway['endpoint_id'] = endpoint_id
-        index.add_document(gateway)
+    _, errors = index.add_documents(device.gateways, refresh="wait_for")
+    log_bulk_errors(errors, hostname)
 
     index = ElasticIndex(zone_index, host=elastic_host, port=elastic_port)
     for zone in device.zones:
         zone['hostname'] = hostname
         zone['endpoint_id'] = endpoint_id
-        index.add_document(zone)
+    _, errors = index.add_documents(device.zones, refresh="wait_for")
+    log_bulk_errors(errors, hostname)
+
+    # the cached endpoint page no longer matches what was just recorded
+    EndpointCache.from_config(appconfig).invalidate(hostname)
 
     logging.info(f"details for {device.hostname} pulled")
 
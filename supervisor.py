@@ -0,0 +1,13 @@
+import logging
+
+from config import Config
+from ctrl import WorkerSupervisor
+
+appconfig = Config()
+
+if __name__ == '__main__':
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s",
+                        datefmt='%Y-%m-%d %H:%M:%S')
+
+    WorkerSupervisor(appconfig).run()
@@ -13,14 +13,20 @@
 # OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 #
 
-from datetime import datetime
+from datetime import datetime, timedelta
+import ipaddress
+import json
 import logging
 
-from models import ElasticIndex
+from models import ElasticIndex, EndpointCache, DeviceBusy
 from redis import Redis
-from rq import Queue
+from rq import Queue, get_current_job
+from rq.job import Job, JobStatus
 from config import Config
-from ctrl import Discover
+from ctrl import Discover, Pipeline
+from ctrl.discover.checkpoint import SweepCheckpoint
+from ctrl.task.dedupe import JobDedupe
+from ctrl.task.jobs import defer
 
 
 appconfig = Config()
@@ -30,6 +36,9 @@ discover = Discover(appconfig)
 redis_host = appconfig.REDIS_HOST
 redis_port = appconfig.REDIS_PORT
 redis_connection = Redis(host=redis_host, port=redis_port, db=0)
+dedupe = JobDedupe(redis_connection, ttl=appconfig.TASK_DEDUPE_TTL)
+endpoint_cache = EndpointCache(redis_connection, ttl=appconfig.ENDPOINT_CACHE_TTL,
+                               max_entries=appconfig.ENDPOINT_CACHE_SIZE)
 
 #elastic configuration
 elastic_host = appconfig.ELASTIC_HOST
@@ -37,66 +46,366 @@ elastic_port = appconfig.ELASTIC_PORT
 endpoint_index = appconfig.ENDPOINT_INDEX
 nmap_index = appconfig.NMAP_INDEX
 
+#nmap batch configuration, device records are kept until the batch scan has had every chance to read them
+nmap_wait = appconfig.NMAP_BATCH_WAIT * (appconfig.NMAP_BATCH_WAIT_RETRIES + 1)
+nmap_handoff_prefix = "leviathan:nmap_batch"
+
 #logging configuration
 # logging.basicConfig(filename="var/log/system.log", level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s",
 #                     datefmt='%Y-%m-%d %H:%M:%S')
 
 
-def run(ip):
+def checkpoint(sweep_id):
+    """ returns the checkpoint for the sweep id, None if the sweep is not checkpointed
+   ----------
+       sweep_id:str
+           id returned by run_network
+   """
+
+    if not sweep_id:
+        return None
+
+    return SweepCheckpoint(redis_connection, sweep_id, ttl=appconfig.SWEEP_CHECKPOINT_TTL)
+
+
+def chunks(cidr, chunk_size):
+    """ splits the network into subnets of chunk_size addresses, rounded down to a power of two
+   ----------
+       cidr:str
+           cidr network to split
+       chunk_size:int
+           number of addresses per chunk
+   """
+
+    network = ipaddress.ip_network(cidr, strict=False)
+
+    #work out the chunk prefix, never larger than the network itself
+    new_prefix = max(network.prefixlen, network.max_prefixlen - (max(int(chunk_size), 1).bit_length() - 1))
+
+    return [str(chunk) for chunk in network.subnets(new_prefix=new_prefix)]
+
+
+def run_network(cidr, chunk_size=None, sweep_id=None):
+    """ splits the network into chunks and enqueues one sweep job per chunk on the default queue
+   ----------
+       cidr:str
+           cidr network to sweep
+       chunk_size:int
+           number of addresses per sweep job, rounded down to a power of two (defaults to SWEEP_CHUNK_SIZE)
+       sweep_id:str
+           id for the sweep checkpoint, a new id is generated if not given
+
+    returns the sweep id that can be passed to resume
+   """
+
+    queue = Queue(connection=redis_connection, name="default")
+
+    if not chunk_size:
+        chunk_size = appconfig.SWEEP_CHUNK_SIZE
+
+    if not sweep_id:
+        sweep_id = SweepCheckpoint.new_id()
+
+    checkpoint(sweep_id).create(cidr, chunk_size)
+
+    job_datas, actions = [], []
+    for chunk in chunks(cidr, chunk_size):
+        job_datas.append(Queue.prepare_data(run, args=(chunk, sweep_id), description=f"Sweep {chunk}"))
+        actions.append(("sweep", chunk))
+
+    jobs = dedupe.enqueue_many(queue, job_datas, actions)
+    logging.info(f"sweep {sweep_id} of {cidr} split into {len(jobs)} jobs")
+
+    return sweep_id
+
+
+def resume(sweep_id):
+    """ resumes a checkpointed sweep, skipping chunks that were swept and hosts that finished each stage
+   ----------
+       sweep_id:str
+           id returned by run_network
+   """
+
+    sweep_checkpoint = checkpoint(sweep_id)
+    meta = sweep_checkpoint.meta()
+
+    if not meta:
+        logging.error(f"sweep {sweep_id} has no checkpoint to resume from")
+        return None
+
+    default_queue = Queue(connection=redis_connection, name="default")
+    high_queue = Queue(connection=redis_connection, name="high")
+
+    #sweep the chunks that never finished
+    chunks_done = sweep_checkpoint.chunks_done()
+    chunk_datas, chunk_actions = [], []
+    for chunk in chunks(meta['cidr'], meta['chunk_size']):
+        if chunk not in chunks_done:
+            chunk_datas.append(Queue.prepare_data(run, args=(chunk, sweep_id), description=f"Sweep {chunk}"))
+            chunk_actions.append(("sweep", chunk))
+
+    #pick up each live host at the first stage it has not finished
+    live = sweep_checkpoint.live()
+    detected = sweep_checkpoint.completed("device_info")
+    scanned = sweep_checkpoint.completed("nmap")
+    detailed = sweep_checkpoint.completed("details")
+    records = sweep_checkpoint.records(live & detected)
+
+    host_datas, host_actions = [], []
+    for ip in sorted(live, key=ipaddress.ip_address):
+        if ip not in detected or ip not in records:
+            host_datas.append(Queue.prepare_data(__record_device_info, args=(ip, True, sweep_id),
+                                                 description=f"Record Device Info {ip}"))
+            host_actions.append(("record_device_info", ip))
+            continue
+
+        record = records[ip]
+
+        if appconfig.NMAP_ENABLED and ip not in scanned:
+            host_datas.append(Queue.prepare_data(__record_nmap_info, args=(record, sweep_id),
+                                                 description=f"Record NMAP Info {ip}"))
+            host_actions.append(("record_nmap_info", ip))
+
+        if record['device_type'] in appconfig.PLUGIN_MODS and ip not in detailed:
+            host_datas.append(Queue.prepare_data(__record_details, args=(record, sweep_id),
+                                                 description=f"Record {record['device_type']} info {ip}"))
+            host_actions.append(("record_details", ip))
+
+    #resuming twice, or while the interrupted jobs are still running, keeps their jobs instead of adding more
+    with redis_connection.pipeline() as pipe:
+        dedupe.enqueue_many(default_queue, chunk_datas, chunk_actions, pipeline=pipe)
+        dedupe.enqueue_many(high_queue, host_datas, host_actions, pipeline=pipe)
+        pipe.execute()
+
+    logging.info(f"resumed sweep {sweep_id} of {meta['cidr']} with {len(chunk_datas)} chunks and "
+                 f"{len(host_datas)} host jobs")
+
+    return sweep_id
+
+
+def run_pipeline(cidr, sweep_id=None):
+    """ discovers the whole network inside this worker using the streaming pipeline instead of chained jobs
+   ----------
+       cidr:str
+           cidr network to discover
+       sweep_id:str
+           id for the sweep checkpoint, pass the id of an interrupted run to resume it
+   """
+
+    if not sweep_id:
+        sweep_id = SweepCheckpoint.new_id()
+
+    sweep_checkpoint = checkpoint(sweep_id)
+    sweep_checkpoint.create(cidr, appconfig.SWEEP_CHUNK_SIZE)
+
+    pipeline = Pipeline(appconfig)
+
+    return pipeline.run(cidr, checkpoint=sweep_checkpoint)
+
+
+def run(ip, sweep_id=None):
     """ initial run method for the entire task
    ----------
        ip:str
-           ip address of target device
+           ip address or cidr network of target device(s)
+       sweep_id:str
+           id of the sweep checkpoint this chunk belongs to
    """
 
     queue = Queue(connection=redis_connection, name="high")
+    sweep_checkpoint = checkpoint(sweep_id)
+
+    live_ips = discover.sweep(ip)
+
+    if live_ips:
+        #resolve the live hosts in one batch so the device info jobs read their hostnames from the cache
+        discover.resolver.resolve_many(live_ips)
+
+        #scan the whole live set with one nmap invocation instead of one per device
+        nmap_batch = appconfig.NMAP_ENABLED and appconfig.NMAP_BATCH
+
+        #enqueue every live host in a single pipelined batch
+        job_datas = []
+        for live_ip in live_ips:
+            job_datas.append(Queue.prepare_data(__record_device_info, args=(live_ip, not nmap_batch, sweep_id),
+                                                description=f"Record Device Info {live_ip}",
+                                                result_ttl=nmap_wait if nmap_batch else None))
+
+        #a host already being recorded by an overlapping sweep keeps its job instead of getting a second one
+        jobs = dedupe.enqueue_many(queue, job_datas, [("record_device_info", live_ip) for live_ip in live_ips])
 
-    result = discover.ping(ip)
-    if result:
-        job = queue.enqueue(__record_device_info, args=(ip,), description=f"Record Device Info {ip}")
-        logging.info(f"ping response from {ip} - Starting job {job.id}")
+        for live_ip, job in zip(live_ips, jobs):
+            logging.info(f"ping response from {live_ip} - Starting job {job.id}")
 
+        #the batch scan polls for the device records so each scan can be tied to its endpoint, a hard
+        #dependency would never run if a single device job failed
+        if nmap_batch:
+            queue.enqueue_in(timedelta(seconds=appconfig.NMAP_BATCH_WAIT), __record_nmap_batch,
+                             kwargs={"sweep_id": sweep_id, "job_ids": [job.id for job in jobs]},
+                             description=f"Record NMAP Info {ip}")
 
-def __record_device_info(ip):
+    #the chunk is only checkpointed once its hosts are enqueued
+    if sweep_checkpoint:
+        sweep_checkpoint.chunk_done(ip, live_ips)
+
+
+def __record_device_info(ip, nmap=True, sweep_id=None):
     """ record the device information after the ping check returns true
        ----------
             ip:str
                ip address of target device#TODO make this explicit instead of implicit
+            nmap:bool
+               enqueue a per-device nmap scan, false when the sweep scans the live set in one batch
+            sweep_id:str
+               id of the sweep checkpoint this device belongs to
        """
 
     index = ElasticIndex(endpoint_index,host=elastic_host, port=elastic_port)
     queue = Queue(connection=redis_connection, name="high")
+    sweep_checkpoint = checkpoint(sweep_id)
+
+    try:
+        record = discover.device_info(ip)
+    except DeviceBusy as e:
+        #another task is logged into the device, try again later instead of failing
+        if defer(appconfig):
+            logging.info(f"{e}, device info for {ip} deferred")
+        raise
 
-    record = discover.device_info(ip)
     record['update_time'] = str(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
 
     #record device in elasticsearch device index
-    record = index.add_document(record)
+    record = index.add_document(record, refresh="wait_for")
+    endpoint_cache.invalidate(record['hostname'])
+
+    if sweep_checkpoint:
+        sweep_checkpoint.complete("device_info", [ip], records=[record])
+
+    #hand the record to the batch scan, or scan the device here when the batch already stopped waiting on this job
+    job = get_current_job()
+    if appconfig.NMAP_ENABLED and not nmap and job:
+        handoff = redis_connection.set(f"{nmap_handoff_prefix}:{job.id}", json.dumps(record), nx=True,
+                                       ex=appconfig.TASK_DEDUPE_TTL)
+        nmap = not handoff
 
     #add the nmap scan to the high queue
-    if appconfig.NMAP_ENABLED:
-        queue.enqueue(__record_nmap_info, args=(record,), description=f"Record NMAP Info {ip}")
+    if appconfig.NMAP_ENABLED and nmap:
+        dedupe.enqueue(queue, "record_nmap_info", ip, __record_nmap_info, args=(record, sweep_id),
+                       description=f"Record NMAP Info {ip}")
 
     if record['device_type'] == "unknown":
         logging.info(f"unable to determine credentials and device_type for {ip}")
-        return
     else:
         logging.info(f"device_type for {ip} discovered: {record['device_type']}")
 
         if record['device_type'] in appconfig.PLUGIN_MODS:
-            plugin_module = appconfig.PLUGINS[record['device_type']]
-            queue.enqueue(plugin_module.record_details, args=(record,appconfig),
-                                            description=f"Record {record['device_type']} info {ip}")
+            dedupe.enqueue(queue, "record_details", ip, __record_details, args=(record, sweep_id),
+                           description=f"Record {record['device_type']} info {ip}")
+
+    return record
+
+def __record_details(record, sweep_id=None):
+    """ record the plugin details for the device
+       ----------
+        record:dict
+           record from __record_device_info
+        sweep_id:str
+           id of the sweep checkpoint this device belongs to
+   """
+    plugin_module = appconfig.PLUGINS[record['device_type']]
 
-def __record_nmap_info(record):
+    try:
+        plugin_module.record_details(record, appconfig)
+    except DeviceBusy as e:
+        #another task is talking to the device, try again later instead of failing
+        if defer(appconfig):
+            logging.info(f"{e}, details for {record['ip']} deferred")
+        raise
+
+    sweep_checkpoint = checkpoint(sweep_id)
+    if sweep_checkpoint:
+        sweep_checkpoint.complete("details", [record['ip']])
+
+def __record_nmap_info(record, sweep_id=None):
     """ record the device information after the ping check returns true
        ----------
         record:dict
            record from __record_device_info
+        sweep_id:str
+           id of the sweep checkpoint this device belongs to
    """
     index = ElasticIndex(nmap_index, host=elastic_host, port=elastic_port)
 
     scan_info = discover.nmap_info(record['ip'],record['hostname'])
     scan_info['endpoint_id'] = record['_id']
-    index.add_document(scan_info)
-    logging.info("nmap scanned device {record['ip']}")
\ No newline at end of file
+    index.add_document(scan_info, refresh="wait_for")
+    endpoint_cache.invalidate(record['hostname'])
+
+    sweep_checkpoint = checkpoint(sweep_id)
+    if sweep_checkpoint:
+        sweep_checkpoint.complete("nmap", [record['ip']])
+
+    logging.info(f"nmap scanned device {record['ip']}")
+
+
+def __record_nmap_batch(records=None, sweep_id=None, job_ids=None, attempt=0):
+    """ record the nmap information for many devices from a single scan
+       ----------
+        records:list
+           records from __record_device_info, defaults to the results of the job_ids
+        sweep_id:str
+           id of the sweep checkpoint these devices belong to
+        job_ids:list
+           ids of the __record_device_info jobs, the scan is scheduled again every NMAP_BATCH_WAIT seconds until
+           none of them are waiting or running, then covers the ones that finished. Jobs still running when it
+           gives up scan their own device
+        attempt:int
+           number of times the scan has already waited
+   """
+    index = ElasticIndex(nmap_index, host=elastic_host, port=elastic_port)
+
+    if records is None:
+        jobs = [job for job in Job.fetch_many(job_ids or [], connection=redis_connection) if job]
+        waiting = [job for job in jobs if job.get_status(refresh=False) in JobDedupe.active]
+
+        if waiting:
+            if attempt < appconfig.NMAP_BATCH_WAIT_RETRIES:
+                queue = Queue(connection=redis_connection, name="high")
+                queue.enqueue_in(timedelta(seconds=appconfig.NMAP_BATCH_WAIT), __record_nmap_batch,
+                                 kwargs={"sweep_id": sweep_id, "job_ids": job_ids, "attempt": attempt + 1},
+                                 description=get_current_job().description)
+                return
+
+            logging.warning(f"nmap batch stopped waiting on {len(waiting)} device jobs")
+
+        #claim each waiting job's handoff so it scans its own device, a job that already handed its record over
+        #in the meantime is covered here instead
+        with redis_connection.pipeline() as pipe:
+            for job in waiting:
+                pipe.set(f"{nmap_handoff_prefix}:{job.id}", "", nx=True, ex=appconfig.TASK_DEDUPE_TTL)
+                pipe.get(f"{nmap_handoff_prefix}:{job.id}")
+            handoffs = pipe.execute()
+
+        records = [job.result for job in jobs if job.get_status(refresh=False) == JobStatus.FINISHED]
+        records += [json.loads(value) for claimed, value in zip(handoffs[::2], handoffs[1::2])
+                    if not claimed and value]
+
+    records = {record['ip']: record for record in records if record}
+
+    hostnames = {ip: record['hostname'] for ip, record in records.items()}
+    scans = discover.nmap_info_many(list(records), hostnames)
+
+    for ip, scan_info in scans.items():
+        scan_info['endpoint_id'] = records[ip]['_id']
+
+    ids, errors = index.add_documents(list(scans.values()), refresh="wait_for")
+    for error in errors:
+        logging.error(f"failed to record nmap info for {error['doc']['hostname']} due to {error['error']}")
+
+    endpoint_cache.invalidate(*hostnames.values())
+
+    sweep_checkpoint = checkpoint(sweep_id)
+    if sweep_checkpoint:
+        sweep_checkpoint.complete("nmap", [ip for ip, doc_id in zip(scans, ids) if doc_id])
+
+    logging.info(f"nmap scanned {len(scans)} devices")
@@ -1,5 +1,3 @@
-import os
-import redis
 from rq import Worker, Queue, Connection
 
 from config import Config
@@ -13,11 +11,11 @@ high_queue = Queue(connection=redis_connection, name="high")
 default_queue = Queue(connection=redis_connection, name="default")
 
 listen = ['default']
-conn_redis = redis.from_url('redis://172.31.10.203:6379')
 
 if __name__ == '__main__':
 
-    with Connection(conn_redis):
+    with Connection(redis_connection):
         worker = Worker(list(map(Queue, listen)))
 
-    worker.work()
+    # the scheduler enqueues jobs deferred while their device was busy
+    worker.work(with_scheduler=True)